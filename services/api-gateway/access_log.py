@@ -0,0 +1,111 @@
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, Optional, TextIO
+
+from instrumentation import ACCESS_LOG_RECORDS
+
+ACCESS_LOGGER_NAME = "gateway.access"
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, сообщение и поля записи из access"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "access", {}))
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не блокирует запрос: при переполненной очереди
+    запись отбрасывается (и считается в метрике), а не ждет вывода.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование (JSON) выполняется в потоке QueueListener, а не в обработчике запроса
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            ACCESS_LOG_RECORDS.labels(result="queued").inc()
+        except queue.Full:
+            ACCESS_LOG_RECORDS.labels(result="dropped").inc()
+
+class AccessLog:
+    """
+    Структурированный access-лог gateway.
+
+    Запись - одна JSON-строка на запрос. Логгер пишет в ограниченную очередь,
+    вывод в поток выполняет отдельный поток QueueListener, поэтому запись лога
+    не блокирует event loop. Успешные быстрые запросы к sampled_paths (/events)
+    логируются с вероятностью sample_rate; ошибки (status >= 400) и медленные
+    запросы (>= slow_ms) логируются всегда.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, sampled_paths: Iterable[str] = (),
+                 slow_ms: float = 1000.0, queue_size: int = 10000,
+                 stream: Optional[TextIO] = None):
+        self.sample_rate = sample_rate
+        self.sampled_paths = frozenset(sampled_paths)
+        self.slow_ms = slow_ms
+
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+        self._listener = QueueListener(self._queue, handler, respect_handler_level=False)
+        self._running = False
+
+        self.logger = logging.getLogger(ACCESS_LOGGER_NAME)
+        self.logger.handlers = [DroppingQueueHandler(self._queue)]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def start(self):
+        if not self._running:
+            self._listener.start()
+            self._running = True
+
+    def stop(self):
+        """Остановка с выводом оставшихся в очереди записей"""
+        if self._running:
+            self._listener.stop()
+            self._running = False
+
+    def should_log(self, path: str, status_code: int, duration_ms: float) -> bool:
+        if status_code >= 400 or duration_ms >= self.slow_ms:
+            return True
+        if path in self.sampled_paths:
+            return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return True
+
+    def log(self, method: str, path: str, status_code: int, duration_ms: float,
+            client: Optional[str] = None, **fields):
+        if not self.should_log(path, status_code, duration_ms):
+            return
+        access = {
+            "method": method,
+            "path": path,
+            "status": status_code,
+            "duration_ms": round(duration_ms, 3),
+            "client": client,
+        }
+        if path in self.sampled_paths and status_code < 400 and duration_ms < self.slow_ms:
+            access["sample_rate"] = self.sample_rate
+        access.update(fields)
+        level = logging.ERROR if status_code >= 500 else logging.WARNING if status_code >= 400 else logging.INFO
+        self.logger.log(level, "request", extra={"access": access})
+
+def monotonic_ms(start: float) -> float:
+    """Миллисекунды с момента start (time.perf_counter())"""
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов gateway на проксирование /events и /auth/*.
+
+Поднимает заглушку upstream'а (ответы auth и collector без работы) и gateway
+в отдельных процессах, затем сравнивает задержку запроса напрямую к заглушке
+и через gateway. Накладные расходы gateway = разница перцентилей.
+
+Режимы:
+    pooled       - долгоживущие клиенты из upstreams.py (текущая реализация)
+    per-request  - новый httpx.AsyncClient на каждый запрос (как было раньше)
+
+Примеры:
+    python bench_gateway.py
+    python bench_gateway.py --mode per-request pooled --requests 5000 --concurrency 32
+
+    # /events с разбором и повторной сериализацией тела в gateway (EVENTS_PASSTHROUGH=false)
+    python bench_gateway.py --mode pooled --parse-events
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+# Логи запросов gateway и httpx искажают замер (наследуется процессами через spawn)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+STUB_PORT = 18101
+GATEWAY_PORT = 18100
+
+EVENT = {
+    "event_type": "button_click",
+    "user_id": "user_001",
+    "session_id": "session_001",
+    "timestamp": "2024-01-01T00:00:00",
+    "url": "/dashboard",
+    "user_agent": "Mozilla/5.0 (X11; Linux x86_64) BenchAgent/1.0",
+    "screen_resolution": "1920x1080",
+    "additional_data": {"button_name": "refresh"}
+}
+
+def run_stub(port: int):
+    """Заглушка auth и collector: мгновенные ответы той же формы"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    stub = FastAPI()
+
+    @stub.post("/events", status_code=202)
+    async def events():
+        return {"message": "Event accepted", "event_id": "bench", "timestamp": "2024-01-01T00:00:00"}
+
+    @stub.post("/login")
+    async def login():
+        return {"access_token": "bench", "token_type": "bearer", "expires_in": 3600}
+
+    @stub.get("/me")
+    async def me():
+        return {"id": 1, "username": "bench", "email": "bench@example.com", "is_active": True}
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+class PerRequestClients:
+    """Прежнее поведение: новый клиент (и TCP-соединение) на каждый запрос"""
+
+    def start(self, base_urls):
+        pass
+
+    async def request(self, base_url: str, method: str, path: str, **kwargs) -> httpx.Response:
+        async with httpx.AsyncClient() as client:
+            return await client.request(method, f"{base_url}{path}", **kwargs)
+
+    async def stream(self, base_url: str, method: str, path: str, **kwargs) -> httpx.Response:
+        client = httpx.AsyncClient()
+        response = await client.send(client.build_request(method, f"{base_url}{path}", **kwargs), stream=True)
+        close_response = response.aclose
+
+        async def aclose():
+            await close_response()
+            await client.aclose()
+
+        response.aclose = aclose
+        return response
+
+    async def close(self):
+        pass
+
+def run_gateway(port: int, upstream_url: str, mode: str):
+    """Gateway с upstream'ами на заглушке и выключенным rate limiting"""
+    os.environ["AUTH_SERVICE_URL"] = upstream_url
+    os.environ["COLLECTOR_SERVICE_URL"] = upstream_url
+
+    import uvicorn
+    import main
+
+    main.limiter.enabled = False
+    if mode == "per-request":
+        main.upstreams = PerRequestClients()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+async def wait_ready(url: str, timeout: float = 15.0):
+    """Ожидание запуска сервера"""
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+async def measure(client: httpx.AsyncClient, method: str, url: str, requests: int,
+                  concurrency: int, **kwargs) -> List[float]:
+    """Задержки requests запросов (мс) при concurrency одновременных запросах"""
+    latencies: List[float] = []
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} failed: {response.status_code} {response.text}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(latencies, n=100)
+    return {"p50": round(cuts[49], 3), "p99": round(cuts[98], 3)}
+
+async def run_mode(mode: str, requests: int, concurrency: int) -> List[dict]:
+    """Прогон одного режима: /events, /auth/login и /auth/me напрямую и через gateway"""
+    stub_url = f"http://127.0.0.1:{STUB_PORT}"
+    gateway_url = f"http://127.0.0.1:{GATEWAY_PORT}"
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_stub, args=(STUB_PORT,), daemon=True),
+        context.Process(target=run_gateway, args=(GATEWAY_PORT, stub_url, mode), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        await wait_ready(f"{stub_url}/docs")
+        await wait_ready(f"{gateway_url}/healthz")
+
+        from main import create_access_token
+        token = create_access_token({"sub": "bench"})
+        cases = [
+            ("/events", "POST", "/events", "/events", {"json": EVENT}),
+            ("/auth/login", "POST", "/login", "/auth/login", {"json": {"username": "bench", "password": "bench"}}),
+            ("/auth/me", "GET", "/me", "/auth/me", {"headers": {"Authorization": f"Bearer {token}"}}),
+        ]
+
+        results = []
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            for name, method, direct_path, gateway_path, kwargs in cases:
+                # Прогрев соединений
+                await measure(client, method, f"{gateway_url}{gateway_path}", concurrency, concurrency, **kwargs)
+                direct = percentiles(await measure(
+                    client, method, f"{stub_url}{direct_path}", requests, concurrency, **kwargs
+                ))
+                via_gateway = percentiles(await measure(
+                    client, method, f"{gateway_url}{gateway_path}", requests, concurrency, **kwargs
+                ))
+                results.append({
+                    "mode": mode,
+                    "endpoint": name,
+                    "direct_p50_ms": direct["p50"],
+                    "direct_p99_ms": direct["p99"],
+                    "gateway_p50_ms": via_gateway["p50"],
+                    "gateway_p99_ms": via_gateway["p99"],
+                    "overhead_p50_ms": round(via_gateway["p50"] - direct["p50"], 3),
+                    "overhead_p99_ms": round(via_gateway["p99"] - direct["p99"], 3)
+                })
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+async def main():
+    parser = argparse.ArgumentParser(description="API gateway proxy overhead benchmark")
+    parser.add_argument("--mode", nargs="+", choices=["per-request", "pooled"], default=["per-request", "pooled"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--parse-events", action="store_true", help="disable /events passthrough in the gateway")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.parse_events:
+        os.environ["EVENTS_PASSTHROUGH"] = "false"
+
+    results = []
+    for mode in args.mode:
+        results.extend(await run_mode(mode, args.requests, args.concurrency))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"🚀 {args.requests} requests per endpoint, concurrency {args.concurrency}")
+    columns = ["mode", "endpoint", "direct_p50_ms", "gateway_p50_ms", "overhead_p50_ms", "overhead_p99_ms"]
+    print(" | ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{str(result[column]):>16}" for column in columns))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+class TTLCache:
+    """
+    Ограниченный LRU-кеш с временем жизни записи.
+
+    Записи хранятся в порядке последнего обращения; при переполнении
+    вытесняется самая давняя. У каждой записи свой срок жизни, просроченная
+    запись удаляется при чтении. Кеш используется из event loop одного
+    процесса, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Значение по ключу или None (нет записи или она просрочена)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """Сохранение значения на ttl секунд"""
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Удаление записи; True, если она была"""
+        return self._entries.pop(key, None) is not None
+
+    def delete_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Удаление записей, значение которых удовлетворяет условию; возвращает их количество"""
+        keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> int:
+        """Удаление всех записей"""
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+    def hit_ratio(self) -> float:
+        """Доля попаданий среди всех обращений"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hit_ratio(), 4)
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых загрузок: пока загрузка по ключу
+    выполняется, остальные вызовы с тем же ключом ждут ее результат,
+    а не обращаются к источнику повторно.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Результат загрузки и признак того, что он получен от чужого вызова"""
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.ensure_future(loader())
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Отмена одного ожидающего запроса не отменяет загрузку для остальных
+        return await asyncio.shield(future), False
+
+    def __len__(self) -> int:
+        return len(self._calls)
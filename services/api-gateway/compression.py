@@ -0,0 +1,184 @@
+import zlib
+from typing import Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость, без нее только gzip
+    brotli = None
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+def choose_encoding(accept_encoding: str, supported: Iterable[str]) -> Optional[str]:
+    """
+    Кодировка из Accept-Encoding с наибольшим q среди поддерживаемых
+    (при равном q - в порядке supported); q=0 запрещает кодировку.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов gzip или brotli по Accept-Encoding клиента.
+
+    Ответы меньше minimum_size и ответы, уже имеющие Content-Encoding
+    (например, переданные из upstream'а как есть), не сжимаются. Размер берется
+    из Content-Length, а без него - по первым фрагментам потокового ответа.
+    Brotli используется, если установлен пакет brotli.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = (ENCODING_BROTLI, ENCODING_GZIP) if brotli_available() else (ENCODING_GZIP,)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+            if encoding is not None:
+                responder = CompressionResponder(self.app, encoding, self._compressor_factory(encoding),
+                                                 self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+    def _compressor_factory(self, encoding: str):
+        if encoding == ENCODING_BROTLI:
+            return lambda: _BrotliCompressor(self.brotli_quality)
+        return lambda: _GzipCompressor(self.gzip_level)
+
+class CompressionResponder:
+    """Сжатие одного ответа (по образцу starlette GZipResponder)"""
+
+    def __init__(self, app: ASGIApp, encoding: str, compressor_factory, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.compressor_factory = compressor_factory
+        self.minimum_size = minimum_size
+        self.send: Optional[Send] = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor = None
+        self.buffer = bytearray()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _set_headers(self, content_length: Optional[int]):
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        # ETag несжатого тела не совпадает со сжатым - помечаем как слабый
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    async def send_compressed(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Заголовки отправляются, когда станет известно, сжимается ли ответ.
+            # Уже сжатые ответы и ответы с Content-Length меньше порога не сжимаются
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            content_length = headers.get("content-length")
+            self.passthrough = "content-encoding" in headers or (
+                content_length is not None and content_length.isdigit()
+                and int(content_length) < self.minimum_size
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            # Размер потокового ответа заранее неизвестен: копим фрагменты до порога
+            self.buffer += body
+            if len(self.buffer) < self.minimum_size:
+                if more_body:
+                    return
+                self.started = True
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send({"type": "http.response.body", "body": bytes(self.buffer)})
+                return
+
+            self.started = True
+            self.compressor = self.compressor_factory()
+            body = self.compressor.compress(bytes(self.buffer))
+            self.buffer = bytearray()
+            if not more_body:
+                body += self.compressor.finish()
+                self._set_headers(len(body))
+            else:
+                self._set_headers(None)
+            await self.send(self.initial_message)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        body = self.compressor.compress(body)
+        if not more_body:
+            body += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
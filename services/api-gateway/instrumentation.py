@@ -0,0 +1,88 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Если задан PROMETHEUS_MULTIPROC_DIR (до импорта prometheus_client), значения
+# метрик воркеров агрегируются в /metrics через MultiProcessCollector.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+TOKEN_CACHE_REQUESTS = Counter(
+    "gateway_token_cache_requests_total",
+    "Verified-token cache lookups",
+    ["result"]
+)
+TOKEN_CACHE_INVALIDATIONS = Counter(
+    "gateway_token_cache_invalidations_total",
+    "Entries removed from the verified-token cache by invalidation hooks"
+)
+TOKEN_CACHE_ENTRIES = Gauge(
+    "gateway_token_cache_entries",
+    "Entries in the verified-token cache",
+    multiprocess_mode="livesum"
+)
+TOKEN_CACHE_HIT_RATIO = Gauge(
+    "gateway_token_cache_hit_ratio",
+    "Verified-token cache hit ratio since process start",
+    multiprocess_mode="liveall"
+)
+ANALYTICS_CACHE_REQUESTS = Counter(
+    "gateway_analytics_cache_requests_total",
+    "Analytics response cache lookups (hit, miss, coalesced miss, 304 not modified)",
+    ["result"]
+)
+ANALYTICS_CACHE_ENTRIES = Gauge(
+    "gateway_analytics_cache_entries",
+    "Entries in the analytics response cache",
+    multiprocess_mode="livesum"
+)
+ACCESS_LOG_RECORDS = Counter(
+    "gateway_access_log_records_total",
+    "Access log records queued for output or dropped because the queue was full",
+    ["result"]
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "gateway_upstream_in_flight",
+    "Requests in flight to an upstream",
+    ["upstream"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "gateway_upstream_concurrency_limit",
+    "Adaptive (AIMD) concurrency limit of an upstream",
+    ["upstream"],
+    multiprocess_mode="liveall"
+)
+UPSTREAM_BREAKER_STATE = Gauge(
+    "gateway_upstream_circuit_state",
+    "Circuit breaker state of an upstream (0 closed, 1 half-open, 2 open)",
+    ["upstream"],
+    multiprocess_mode="liveall"
+)
+UPSTREAM_SHED = Counter(
+    "gateway_upstream_shed_total",
+    "Requests rejected without calling the upstream (circuit open or concurrency limit)",
+    ["upstream", "reason"]
+)
+JWT_VERIFICATIONS = Counter(
+    "gateway_jwt_verifications_total",
+    "Local JWT checks (cached claims, verified signature, invalid token)",
+    ["result"]
+)
+JWT_CLAIMS_CACHE_ENTRIES = Gauge(
+    "gateway_jwt_claims_cache_entries",
+    "Entries in the verified JWT claims cache",
+    multiprocess_mode="livesum"
+)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Выдача метрик в формате Prometheus (с агрегацией по воркерам в multiprocess-режиме)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,19 +1,36 @@
 import os
+import hashlib
+import inspect
 import logging
+import math
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Hashable, List, Literal, Tuple
 
-import httpx
-from fastapi import FastAPI, Request, HTTPException, Depends, status
+import orjson
+from fastapi import FastAPI, Request, HTTPException, Depends, Header, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from jose import JWTError, jwt
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from starlette.background import BackgroundTask
+
+from upstreams import create_upstream_clients
+from resilience import UpstreamUnavailableError
+from rate_limit import create_limiter
+from tokens import create_token_verifier, read_key
+from access_log import AccessLog, monotonic_ms
+from compression import CompressionMiddleware
+from cache import TTLCache, SingleFlight
+from instrumentation import (
+    TOKEN_CACHE_REQUESTS, TOKEN_CACHE_INVALIDATIONS, TOKEN_CACHE_ENTRIES,
+    TOKEN_CACHE_HIT_RATIO, ANALYTICS_CACHE_REQUESTS, ANALYTICS_CACHE_ENTRIES,
+    JWT_CLAIMS_CACHE_ENTRIES, render_metrics
+)
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -28,8 +45,15 @@ logger = logging.getLogger(__name__)
 # Конфигурация
 class Config:
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-key-change-in-production")
-    JWT_ALGORITHM = "HS256"
+    # HS256/HS384/HS512 - общий секрет; RS*/ES* - публичный ключ для проверки
+    # (и закрытый, если gateway сам подписывает токены)
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+    JWT_PUBLIC_KEY = read_key(os.getenv("JWT_PUBLIC_KEY", ""), os.getenv("JWT_PUBLIC_KEY_FILE", ""))
+    JWT_PRIVATE_KEY = read_key(os.getenv("JWT_PRIVATE_KEY", ""), os.getenv("JWT_PRIVATE_KEY_FILE", ""))
     JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
+    # Кеш проверенных JWT (claims до exp токена, не дольше TTL)
+    JWT_CLAIMS_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CLAIMS_CACHE_MAX_ENTRIES", "10000"))
+    JWT_CLAIMS_CACHE_TTL_SECONDS = float(os.getenv("JWT_CLAIMS_CACHE_TTL_SECONDS", "300"))
     
     # URLs сервисов (пока заглушки)
     AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth:8001")
@@ -38,19 +62,147 @@ class Config:
     
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 
+    # Максимальный размер тела пачки событий
+    MAX_BATCH_BODY_BYTES = int(os.getenv("MAX_BATCH_BODY_BYTES", str(1024 * 1024)))
+
+    # /events: тело передается в Collector как есть (валидирует Collector), без разбора в gateway
+    EVENTS_PASSTHROUGH = os.getenv("EVENTS_PASSTHROUGH", "true").lower() == "true"
+    MAX_EVENT_BODY_BYTES = int(os.getenv("MAX_EVENT_BODY_BYTES", str(64 * 1024)))
+
+    # Кеш проверенных токенов (/auth/verify, /auth/me): TTL не больше срока действия токена
+    TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+    TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+    # Кеш ответов /analytics/events/*: ключ - путь, параметры запроса и временной интервал (bucket).
+    # Закрытые интервалы в прошлом не меняются и кешируются надолго, текущий - коротко.
+    ANALYTICS_BUCKET_SECONDS = int(os.getenv("ANALYTICS_BUCKET_SECONDS", "60"))
+    ANALYTICS_OPEN_BUCKET_TTL = float(os.getenv("ANALYTICS_OPEN_BUCKET_TTL", "5"))
+    ANALYTICS_CLOSED_BUCKET_TTL = float(os.getenv("ANALYTICS_CLOSED_BUCKET_TTL", "3600"))
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "1000"))
+
+    # Rate limiting: хранилище счетчиков (memory:// - в процессе, redis://... - общее для реплик),
+    # стратегия (fixed-window, sliding-window-counter, moving-window) и ключ клиента (ip, user, api_key)
+    RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+    RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "fixed-window")
+    RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")
+    RATE_LIMIT_STORAGE_TIMEOUT = float(os.getenv("RATE_LIMIT_STORAGE_TIMEOUT", "0.1"))
+    RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.1"))
+    RATE_LIMIT_EVENTS = os.getenv("RATE_LIMIT_EVENTS", "100/minute")
+
+    # Access-лог (JSON через очередь): доля логируемых успешных /events и /events/batch,
+    # порог медленного запроса (такие и ошибки логируются всегда) и размер очереди
+    ACCESS_LOG_EVENTS_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_EVENTS_SAMPLE_RATE", "0.01"))
+    ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "500"))
+    ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+
+    # Сжатие ответов (brotli или gzip по Accept-Encoding) больше порога в байтах
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    # Ключ для служебных эндпоинтов (/internal/*); если не задан, они отключены
+    INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "")
+
+    # Пулы соединений к сервисам (на каждый upstream отдельно)
+    UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+    UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+    UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "2"))
+    UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+    # Предохранитель (ошибок подряд до открытия, секунд до пробного запроса) и адаптивный
+    # лимит параллельных запросов к upstream'у (AIMD по задержке, не больше UPSTREAM_MAX_CONNECTIONS)
+    UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+    UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "10"))
+    UPSTREAM_CONCURRENCY_INITIAL = int(os.getenv("UPSTREAM_CONCURRENCY_INITIAL", "20"))
+    UPSTREAM_CONCURRENCY_MIN = int(os.getenv("UPSTREAM_CONCURRENCY_MIN", "2"))
+    UPSTREAM_LATENCY_TARGET_MS = float(os.getenv("UPSTREAM_LATENCY_TARGET_MS", "250"))
+
 config = Config()
 
+# Долгоживущие HTTP-клиенты к сервисам
+upstreams = create_upstream_clients(
+    max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+    max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+    keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+    connect_timeout=config.UPSTREAM_CONNECT_TIMEOUT,
+    read_timeout=config.UPSTREAM_READ_TIMEOUT,
+    pool_timeout=config.UPSTREAM_POOL_TIMEOUT,
+    http2=config.UPSTREAM_HTTP2,
+    breaker_failures=config.UPSTREAM_BREAKER_FAILURES,
+    breaker_reset_seconds=config.UPSTREAM_BREAKER_RESET_SECONDS,
+    concurrency_initial=config.UPSTREAM_CONCURRENCY_INITIAL,
+    concurrency_min=config.UPSTREAM_CONCURRENCY_MIN,
+    latency_target_ms=config.UPSTREAM_LATENCY_TARGET_MS
+)
+
+# Локальная проверка JWT: ключ подготавливается при старте, claims кешируются
+token_verifier = create_token_verifier(
+    algorithm=config.JWT_ALGORITHM,
+    secret_key=config.JWT_SECRET_KEY,
+    public_key=config.JWT_PUBLIC_KEY,
+    private_key=config.JWT_PRIVATE_KEY,
+    cache_max_entries=config.JWT_CLAIMS_CACHE_MAX_ENTRIES,
+    cache_ttl=config.JWT_CLAIMS_CACHE_TTL_SECONDS
+)
+
+# Пользователи, проверенные auth-сервисом, по sha256 токена
+token_cache = TTLCache(max_entries=config.TOKEN_CACHE_MAX_ENTRIES)
+
+# Готовые ответы аналитики (тело и ETag) и объединение одновременных промахов
+analytics_cache = TTLCache(max_entries=config.ANALYTICS_CACHE_MAX_ENTRIES)
+analytics_loads = SingleFlight()
+
+# Access-лог запросов (вывод в отдельном потоке)
+access_log = AccessLog(
+    sample_rate=config.ACCESS_LOG_EVENTS_SAMPLE_RATE,
+    sampled_paths=("/events", "/events/batch"),
+    slow_ms=config.ACCESS_LOG_SLOW_MS,
+    queue_size=config.ACCESS_LOG_QUEUE_SIZE
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Создание пулов соединений и запуск access-лога при старте, их закрытие при остановке"""
+    access_log.start()
+    upstreams.start([
+        config.AUTH_SERVICE_URL,
+        config.COLLECTOR_SERVICE_URL,
+        config.ANALYTICS_SERVICE_URL
+    ])
+    yield
+    await upstreams.close()
+    access_log.stop()
+
 # Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+limiter = create_limiter(
+    storage_uri=config.RATE_LIMIT_STORAGE_URI,
+    strategy=config.RATE_LIMIT_STRATEGY,
+    key=config.RATE_LIMIT_KEY,
+    verify_token=token_verifier.verify,
+    storage_timeout=config.RATE_LIMIT_STORAGE_TIMEOUT,
+    sync_interval=config.RATE_LIMIT_SYNC_INTERVAL
+)
 
 # FastAPI app
 app = FastAPI(
     title="Event Analytics API Gateway",
     description="Central gateway for Event Analytics Dashboard",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Сериализация ответов через orjson
+    default_response_class=ORJSONResponse
 )
 
 # Middleware
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.COMPRESSION_MIN_BYTES,
+    gzip_level=config.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=config.COMPRESSION_BROTLI_QUALITY
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config.CORS_ORIGINS,
@@ -86,6 +238,11 @@ class LoginResponse(BaseModel):
     token_type: str = "bearer"
     expires_in: int
 
+class TokenCacheInvalidation(BaseModel):
+    # Без username и user_id кеш очищается полностью
+    username: Optional[str] = None
+    user_id: Optional[int] = None
+
 # JWT utilities
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -95,21 +252,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(hours=config.JWT_EXPIRATION_HOURS)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, config.JWT_SECRET_KEY, algorithm=config.JWT_ALGORITHM)
-    return encoded_jwt
+    return token_verifier.sign(to_encode)
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
         return None
     
-    try:
-        payload = jwt.decode(credentials.credentials, config.JWT_SECRET_KEY, algorithms=[config.JWT_ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-        return {"username": username, "token": credentials.credentials}
-    except JWTError:
+    payload = token_verifier.verify(credentials.credentials)
+    if payload is None:
         return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    return {"username": username, "token": credentials.credentials, "exp": payload.get("exp")}
 
 def require_auth(user = Depends(verify_token)):
     if not user:
@@ -123,17 +278,16 @@ def require_auth(user = Depends(verify_token)):
 # Middleware для логирования запросов
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = datetime.utcnow()
-    
-    # Логируем входящий запрос
-    logger.info(f"Incoming request: {request.method} {request.url.path} from {request.client.host}")
-    
-    response = await call_next(request)
-    
-    # Логируем время обработки
-    process_time = (datetime.utcnow() - start_time).total_seconds()
-    logger.info(f"Request processed in {process_time:.3f}s with status {response.status_code}")
+    # Одна запись access-лога на запрос; время по монотонным часам
+    start = time.perf_counter()
+    client = request.client.host if request.client else None
+    try:
+        response = await call_next(request)
+    except Exception:
+        access_log.log(request.method, request.url.path, 500, monotonic_ms(start), client)
+        raise
     
+    access_log.log(request.method, request.url.path, response.status_code, monotonic_ms(start), client)
     return response
 
 # Health check
@@ -141,6 +295,16 @@ async def log_requests(request: Request, call_next):
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    """Метрики gateway в формате Prometheus"""
+    TOKEN_CACHE_ENTRIES.set(len(token_cache))
+    TOKEN_CACHE_HIT_RATIO.set(token_cache.hit_ratio())
+    ANALYTICS_CACHE_ENTRIES.set(len(analytics_cache))
+    JWT_CLAIMS_CACHE_ENTRIES.set(len(token_verifier))
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
 # Auth endpoints (proxy to Auth Service)
 @app.post("/auth/login")
 @limiter.limit("5/minute")
@@ -166,34 +330,91 @@ async def register(request: Request, user_data: dict):
 
 @app.get("/auth/verify")
 async def verify_user(user = Depends(require_auth)):
-    # Forward to auth service for verification
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{config.AUTH_SERVICE_URL}/verify",
-            headers={"Authorization": f"Bearer {user['token']}"}
-        )
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Token verification failed"
-            )
+    # Forward to auth service for verification (результат кешируется)
+    return await get_verified_user(user, "/verify")
 
 @app.get("/auth/me")
 async def get_current_user(user = Depends(require_auth)):
-    return await proxy_request(
+    return await get_verified_user(user, "/me")
+
+async def get_verified_user(user: dict, path: str) -> dict:
+    """
+    Данные пользователя от auth-сервиса для токена.
+    Успешный ответ кешируется по sha256 токена на TOKEN_CACHE_TTL_SECONDS,
+    но не дольше срока действия токена (exp); ошибки не кешируются.
+    """
+    key = hashlib.sha256(user["token"].encode("utf-8")).hexdigest()
+    cached = token_cache.get(key)
+    if cached is not None:
+        TOKEN_CACHE_REQUESTS.labels(result="hit").inc()
+        return cached
+    TOKEN_CACHE_REQUESTS.labels(result="miss").inc()
+    
+    data = await proxy_request(
         config.AUTH_SERVICE_URL,
-        "/me",
+        path,
         "GET",
         headers={"Authorization": f"Bearer {user['token']}"}
     )
+    
+    ttl = config.TOKEN_CACHE_TTL_SECONDS
+    if user.get("exp"):
+        ttl = min(ttl, user["exp"] - time.time())
+    token_cache.set(key, data, ttl)
+    TOKEN_CACHE_ENTRIES.set(len(token_cache))
+    return data
+
+def require_internal_key(x_internal_key: Optional[str] = Header(None)):
+    if not config.INTERNAL_API_KEY or x_internal_key != config.INTERNAL_API_KEY:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+@app.post("/internal/token-cache/invalidate", dependencies=[Depends(require_internal_key)])
+async def invalidate_token_cache(invalidation: TokenCacheInvalidation):
+    """
+    Хук инвалидации кеша токенов (вызывается при деактивации или изменении пользователя)
+    """
+    if invalidation.username is None and invalidation.user_id is None:
+        removed = token_cache.clear()
+    else:
+        removed = token_cache.delete_where(
+            lambda data: data.get("username") == invalidation.username
+            or (invalidation.user_id is not None and data.get("id") == invalidation.user_id)
+        )
+    # Claims проверенных JWT тоже, чтобы следующий запрос пользователя проверял токен заново
+    token_verifier.invalidate(invalidation.username, invalidation.user_id)
+    TOKEN_CACHE_INVALIDATIONS.inc(removed)
+    TOKEN_CACHE_ENTRIES.set(len(token_cache))
+    JWT_CLAIMS_CACHE_ENTRIES.set(len(token_verifier))
+    logger.info(f"Token cache invalidated: {removed} entries removed")
+    return {"invalidated": removed}
 
 # Events endpoints
-@app.post("/events", status_code=202)
-@limiter.limit("100/minute")
-async def collect_event(request: Request, event: EventPayload):
-    logger.info(f"Received event: {event.event_type} from user {event.user_id}")
+@app.post(
+    "/events",
+    status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": EventPayload.model_json_schema()}}
+        }
+    }
+)
+@limiter.limit(config.RATE_LIMIT_EVENTS)
+async def collect_event(request: Request):
+    if config.EVENTS_PASSTHROUGH:
+        # Тело и ответ Collector передаются потоком без разбора JSON
+        return await passthrough_request(
+            config.COLLECTOR_SERVICE_URL,
+            "/events",
+            request,
+            config.MAX_EVENT_BODY_BYTES
+        )
+    
+    try:
+        event = EventPayload.model_validate_json(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.debug(f"Received event: {event.event_type} from user {event.user_id}")
     
     # Проксируем запрос в Collector Service
     return await proxy_request(
@@ -203,62 +424,266 @@ async def collect_event(request: Request, event: EventPayload):
         json=event.dict()
     )
 
+@app.post("/events/batch", status_code=202)
+@limiter.limit(config.RATE_LIMIT_EVENTS)
+async def collect_events_batch(request: Request):
+    # Тело пачки (JSON-массив или NDJSON) валидирует Collector, здесь только проверяем размер
+    body = await read_body_limited(request, config.MAX_BATCH_BODY_BYTES)
+    if not body:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+
+    logger.debug(f"Received event batch of {len(body)} bytes")
+
+    return await proxy_request(
+        config.COLLECTOR_SERVICE_URL,
+        "/events/batch",
+        "POST",
+        content=body,
+        headers={"Content-Type": request.headers.get("content-type", "application/json")}
+    )
+
 # Analytics endpoints (заглушки)
 @app.get("/analytics/events/count")
-async def get_event_count(user = Depends(require_auth)):
+async def get_event_count(request: Request, user = Depends(require_auth)):
     # Заглушка
-    return {"total_events": 1247, "today": 89}
+    return await cached_analytics(request, lambda: {"total_events": 1247, "today": 89})
+
+# Формат списков аналитики: rows - массив объектов, columnar - объект с массивом на каждое поле
+AnalyticsFormat = Literal["rows", "columnar"]
+FORMAT_QUERY = Query("rows", alias="format", description="rows | columnar")
 
 @app.get("/analytics/events/by-type")
-async def get_events_by_type(user = Depends(require_auth)):
+async def get_events_by_type(request: Request, response_format: AnalyticsFormat = FORMAT_QUERY,
+                             user = Depends(require_auth)):
     # Заглушка
-    return [
+    return await cached_analytics(request, lambda: [
         {"event_type": "button_click", "count": 456},
         {"event_type": "page_view", "count": 789},
         {"event_type": "feature_usage", "count": 123}
-    ]
+    ], columns={"event_type": "event_types", "count": "counts"} if response_format == "columnar" else None)
 
 @app.get("/analytics/events/by-user")
-async def get_events_by_user(user = Depends(require_auth)):
+async def get_events_by_user(request: Request, response_format: AnalyticsFormat = FORMAT_QUERY,
+                             user = Depends(require_auth)):
     # Заглушка
-    return [
+    return await cached_analytics(request, lambda: [
         {"user_id": "user_001", "count": 45},
         {"user_id": "user_002", "count": 67},
         {"user_id": "user_003", "count": 23}
-    ]
+    ], columns={"user_id": "user_ids", "count": "counts"} if response_format == "columnar" else None)
 
 @app.get("/analytics/events/timeseries")
-async def get_events_timeseries(user = Depends(require_auth)):
+async def get_events_timeseries(request: Request, response_format: AnalyticsFormat = FORMAT_QUERY,
+                                user = Depends(require_auth)):
     # Заглушка
-    return [
+    return await cached_analytics(request, lambda: [
         {"timestamp": "2024-01-01T00:00:00Z", "count": 12},
         {"timestamp": "2024-01-01T01:00:00Z", "count": 23},
         {"timestamp": "2024-01-01T02:00:00Z", "count": 34}
-    ]
+    ], columns={"timestamp": "timestamps", "count": "counts"} if response_format == "columnar" else None)
+
+def to_columnar(rows: List[Dict[str, Any]], columns: Dict[str, str]) -> Dict[str, List[Any]]:
+    """Строки в колонки: {"timestamp": ..., "count": ...} -> {"timestamps": [...], "counts": [...]}"""
+    return {column: [row.get(field) for row in rows] for field, column in columns.items()}
+
+# Параметры, не влияющие на результат (защита от cache-busting)
+ANALYTICS_IGNORED_PARAMS = {"_", "ts", "nocache"}
+
+def parse_query_time(value: Optional[str]) -> Optional[float]:
+    """Unix-время из параметра запроса (ISO-8601 или секунды)"""
+    if not value:
+        return None
+    try:
+        timestamp = float(value)
+    except ValueError:
+        pass
+    else:
+        # nan/inf не время: такой параметр считается отсутствующим
+        return timestamp if math.isfinite(timestamp) else None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+def analytics_cache_key(request: Request) -> Tuple[Hashable, float]:
+    """
+    Ключ кеша и TTL для запроса аналитики.
+    Ключ - путь, отсортированные параметры и номер временного интервала:
+    если конец периода (end) в закрытом интервале прошлого, ответ не изменится
+    и кешируется на ANALYTICS_CLOSED_BUCKET_TTL, иначе (текущий интервал) -
+    на ANALYTICS_OPEN_BUCKET_TTL.
+    """
+    params = tuple(sorted(
+        (name, value) for name, value in request.query_params.multi_items()
+        if name not in ANALYTICS_IGNORED_PARAMS
+    ))
+    bucket_seconds = config.ANALYTICS_BUCKET_SECONDS
+    current_bucket = int(time.time() // bucket_seconds)
+    end = parse_query_time(request.query_params.get("end"))
+    if end is not None and int(end // bucket_seconds) < current_bucket:
+        return (request.url.path, params, int(end // bucket_seconds)), config.ANALYTICS_CLOSED_BUCKET_TTL
+    return (request.url.path, params, current_bucket), config.ANALYTICS_OPEN_BUCKET_TTL
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (список ETag, слабые ETag, "*")"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+async def cached_analytics(request: Request, loader: Callable[[], Any],
+                           columns: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Ответ аналитики из кеша; при промахе loader (функция или корутина) выполняется
+    один раз для всех одновременных одинаковых запросов.
+    columns - переименование полей строк в колонки для формата columnar.
+    Клиент с актуальным ETag в If-None-Match получает 304 без тела.
+    """
+    key, ttl = analytics_cache_key(request)
+    entry = analytics_cache.get(key)
+    if entry is not None:
+        ANALYTICS_CACHE_REQUESTS.labels(result="hit").inc()
+    else:
+        async def load():
+            data = loader()
+            if inspect.isawaitable(data):
+                data = await data
+            if columns is not None:
+                data = to_columnar(data, columns)
+            body = orjson.dumps(data, default=str)
+            loaded = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+            analytics_cache.set(key, loaded, ttl)
+            return loaded
+        
+        entry, shared = await analytics_loads.do(key, load)
+        ANALYTICS_CACHE_REQUESTS.labels(result="coalesced" if shared else "miss").inc()
+    
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(ttl)}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        ANALYTICS_CACHE_REQUESTS.labels(result="not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # Generic proxy function (для будущего использования)
 async def proxy_request(service_url: str, path: str, method: str, **kwargs):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.request(method, f"{service_url}{path}", **kwargs)
-            
-            # Проксируем HTTP статус от оригинального сервиса
-            if response.status_code >= 400:
-                try:
-                    error_data = response.json()
-                    raise HTTPException(status_code=response.status_code, detail=error_data.get('detail', 'Request failed'))
-                except ValueError:
-                    # Если не JSON
-                    raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        response = await upstreams.request(service_url, method, path, **kwargs)
+        
+        # Проксируем HTTP статус от оригинального сервиса
+        if response.status_code >= 400:
+            try:
+                error_data = response.json()
+                raise HTTPException(status_code=response.status_code, detail=error_data.get('detail', 'Request failed'))
+            except ValueError:
+                # Если не JSON
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+        
+        return response.json()
     except HTTPException:
         # Повторно выбрасываем HTTPException
         raise
+    except UpstreamUnavailableError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         logger.error(f"Error proxying to {service_url}{path}: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
+def upstream_unavailable(error: UpstreamUnavailableError) -> HTTPException:
+    """Быстрый отказ без обращения к перегруженному или недоступному upstream'у"""
+    detail = "Service temporarily unavailable" if error.status_code == 503 else "Service overloaded, retry later"
+    return HTTPException(
+        status_code=error.status_code,
+        detail=detail,
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+class BodyTooLargeError(Exception):
+    """Тело запроса превышает допустимый размер"""
+
+def declared_content_length(request: Request, max_bytes: int) -> int:
+    """Content-Length запроса (0, если не задан); 400 при некорректном значении, 413 при превышении"""
+    value = request.headers.get("content-length")
+    if not value:
+        return 0
+    try:
+        content_length = int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if content_length < 0:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if content_length > max_bytes:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    return content_length
+
+async def read_body_limited(request: Request, max_bytes: int) -> bytes:
+    """
+    Чтение тела запроса с ограничением размера. Content-Length проверяется заранее,
+    но chunked-тело без него тоже не должно читаться в память без предела.
+    """
+    declared_content_length(request, max_bytes)
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail="Request body too large")
+    return bytes(body)
+
+# Заголовки ответа upstream'а, передаваемые клиенту в режиме passthrough
+PASSTHROUGH_RESPONSE_HEADERS = ("content-type", "content-encoding", "content-length", "retry-after")
+
+async def passthrough_request(service_url: str, path: str, request: Request, max_bytes: int):
+    """
+    Потоковая передача тела запроса в сервис и ответа сервиса клиенту без декодирования.
+    Gateway проверяет только размер и то, что тело похоже на JSON-объект.
+    """
+    content_length = declared_content_length(request, max_bytes)
+    
+    # Первый непустой фрагмент тела: проверка формы без разбора JSON
+    chunks = request.stream()
+    first = b""
+    async for chunk in chunks:
+        first += chunk
+        if len(first) > max_bytes:
+            raise HTTPException(status_code=413, detail="Request body too large")
+        if first.strip():
+            break
+    if not first.lstrip().startswith(b"{"):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    
+    async def body():
+        size = len(first)
+        yield first
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise BodyTooLargeError()
+            yield chunk
+    
+    headers = {"Content-Type": request.headers.get("content-type", "application/json")}
+    if content_length:
+        headers["Content-Length"] = str(content_length)
+    try:
+        response = await upstreams.stream(service_url, "POST", path, content=body(), headers=headers)
+    except BodyTooLargeError:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    except UpstreamUnavailableError as e:
+        raise upstream_unavailable(e)
+    except Exception as e:
+        logger.error(f"Error proxying to {service_url}{path}: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={
+            name: value for name, value in response.headers.items()
+            if name.lower() in PASSTHROUGH_RESPONSE_HEADERS
+        },
+        background=BackgroundTask(response.aclose)
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Запросы логирует access-лог gateway, access-лог uvicorn отключен
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, access_log=False)
\ No newline at end of file
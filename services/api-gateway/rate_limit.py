@@ -0,0 +1,251 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Request
+from limits.storage import RedisStorage, Storage
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+logger = logging.getLogger(__name__)
+
+# Чем идентифицируется клиент для лимитов
+RATE_LIMIT_KEY_IP = "ip"
+RATE_LIMIT_KEY_USER = "user"
+RATE_LIMIT_KEY_API_KEY = "api_key"
+RATE_LIMIT_KEYS = (RATE_LIMIT_KEY_IP, RATE_LIMIT_KEY_USER, RATE_LIMIT_KEY_API_KEY)
+
+API_KEY_HEADER = "x-api-key"
+
+BATCHED_SCHEME_PREFIX = "batched+"
+
+class _WindowCounter:
+    """
+    Счетчик окна одного ключа: итог из Redis на момент синхронизации, прирост,
+    отправляемый сейчас (sending), и прирост после начала синхронизации (pending)
+    """
+    __slots__ = ("expires_at", "synced", "sending", "pending")
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        self.synced = 0
+        self.sending = 0
+        self.pending = 0
+
+    @property
+    def value(self) -> int:
+        return self.synced + self.sending + self.pending
+
+class BatchedRedisStorage(Storage):
+    """
+    Хранилище fixed-window счетчиков для limits: проверка лимита - только
+    память процесса, обмен с Redis - в фоновом потоке раз в sync_interval.
+
+    slowapi вызывает хранилище синхронно внутри async-обработчика, поэтому
+    RedisStorage делает round trip к Redis на event loop для каждого запроса
+    (до socket_timeout, если Redis тормозит). Здесь запрос только увеличивает
+    локальный счетчик, а поток пачкой (один pipeline) отправляет накопленные
+    приросты INCRBY с EXPIRE и забирает общие значения всех реплик.
+
+    Цена - точность: за один интервал синхронизации каждая реплика может
+    пропустить сверх лимита столько запросов, сколько получили остальные.
+    При недоступности Redis приросты копятся и отправляются позже, лимит
+    продолжает считаться по локальным данным.
+
+    URI: "batched+redis://host:port/db" (параметр sync_interval в секундах
+    передается через storage_options).
+    """
+
+    STORAGE_SCHEME = ["batched+redis", "batched+rediss"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, sync_interval: float = 0.1,
+                 key_prefix: str = RedisStorage.PREFIX, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.sync_interval = sync_interval
+        self.redis = RedisStorage(uri[len(BATCHED_SCHEME_PREFIX):], key_prefix=key_prefix,
+                                  wrap_exceptions=wrap_exceptions, **options)
+        self._counters: Dict[str, _WindowCounter] = {}
+        self._expiries: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def base_exceptions(self):
+        return self.redis.base_exceptions
+
+    def _counter(self, key: str, expiry: int) -> _WindowCounter:
+        now = time.time()
+        counter = self._counters.get(key)
+        if counter is None or counter.expires_at <= now:
+            counter = self._counters[key] = _WindowCounter(now + expiry)
+            self._expiries[key] = expiry
+        return counter
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            counter = self._counter(key, expiry)
+            counter.pending += amount
+            return counter.value
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter.expires_at <= time.time():
+                return 0
+            return counter.value
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            counter = self._counters.get(key)
+            return counter.expires_at if counter is not None else time.time()
+
+    def check(self) -> bool:
+        return self.redis.check()
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._counters.clear()
+            self._expiries.clear()
+        return self.redis.reset()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+            self._expiries.pop(key, None)
+        self.redis.clear(key)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._sync_loop, name="rate-limit-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+
+    def _sync_loop(self):
+        failing = False
+        while not self._stopped.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                # Одно сообщение на период недоступности, а не на каждую попытку
+                if not failing:
+                    logger.warning(f"Rate limit counters sync with Redis failed, counting locally: {e}")
+                failing = True
+                continue
+            if failing:
+                logger.info("Rate limit counters sync with Redis restored")
+                failing = False
+
+    def sync(self):
+        """Одна синхронизация: приросты всех ключей в Redis, общие значения обратно"""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, counter in self._counters.items() if counter.expires_at <= now]:
+                del self._counters[key]
+                del self._expiries[key]
+            batch: List[tuple] = []
+            for key, counter in self._counters.items():
+                batch.append((key, counter, counter.pending, self._expiries[key]))
+                counter.sending, counter.pending = counter.pending, 0
+        if not batch:
+            return
+
+        try:
+            pipeline = self.redis.get_connection().pipeline(transaction=False)
+            for key, _, delta, expiry in batch:
+                prefixed = self.redis.prefixed_key(key)
+                if delta:
+                    self.redis.lua_incr_expire([prefixed], [expiry, delta], client=pipeline)
+                else:
+                    pipeline.get(prefixed)
+            results = pipeline.execute()
+        except Exception:
+            # Приросты вернутся в счетчики и уйдут со следующей синхронизацией
+            with self._lock:
+                for _, counter, delta, _ in batch:
+                    counter.sending = 0
+                    counter.pending += delta
+            raise
+
+        with self._lock:
+            for (_, counter, _, _), total in zip(batch, results):
+                # Итог Redis уже включает отправленный прирост
+                counter.synced = int(total or 0)
+                counter.sending = 0
+
+def user_key_func(verify_token: Callable[[str], Optional[Dict[str, Any]]]) -> Callable[[Request], str]:
+    """
+    Ключ - пользователь из JWT (sub). Подпись проверяется, иначе клиент обходил
+    бы лимит, подставляя произвольный sub; без валидного токена - IP-адрес.
+    """
+    def key_func(request: Request) -> str:
+        authorization = request.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            claims = verify_token(token)
+            if claims and claims.get("sub"):
+                return f"user:{claims['sub']}"
+        return f"ip:{get_remote_address(request)}"
+    return key_func
+
+def api_key_func(request: Request) -> str:
+    """Ключ - заголовок X-API-Key; без него - IP-адрес"""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{get_remote_address(request)}"
+
+def create_limiter(storage_uri: str, strategy: str, key: str,
+                   verify_token: Callable[[str], Optional[Dict[str, Any]]],
+                   storage_timeout: float = 0.1, sync_interval: float = 0.1) -> Limiter:
+    """
+    Limiter с общим хранилищем счетчиков.
+
+    storage_uri - хранилище библиотеки limits: "memory://" (счетчики в процессе,
+    для разработки и тестов), "redis://host:port/db" (общие счетчики всех
+    реплик, но каждая проверка - синхронный запрос к Redis на event loop) или
+    "batched+redis://host:port/db" (общие счетчики с локальной проверкой и
+    синхронизацией раз в sync_interval, только fixed-window; см.
+    BatchedRedisStorage). Если хранилище недоступно, лимиты временно
+    считаются в памяти процесса, запросы не отклоняются из-за ошибки хранилища.
+    """
+    key_funcs: Dict[str, Callable[[Request], str]] = {
+        RATE_LIMIT_KEY_IP: get_remote_address,
+        RATE_LIMIT_KEY_USER: user_key_func(verify_token),
+        RATE_LIMIT_KEY_API_KEY: api_key_func,
+    }
+    if key not in key_funcs:
+        raise ValueError(f"Unknown rate limit key {key!r}, expected one of {', '.join(RATE_LIMIT_KEYS)}")
+
+    storage_options: Dict[str, Any] = {}
+    if storage_uri.startswith(BATCHED_SCHEME_PREFIX):
+        if strategy != "fixed-window":
+            raise ValueError(f"{storage_uri.split('://')[0]} storage supports only the fixed-window strategy")
+        storage_options = {"sync_interval": sync_interval}
+        redis_uri = storage_uri[len(BATCHED_SCHEME_PREFIX):]
+    else:
+        redis_uri = storage_uri
+    if redis_uri.startswith(("redis://", "rediss://")):
+        # Зависший Redis не должен задерживать запросы: короткие таймауты и переход на память
+        storage_options.update(socket_timeout=storage_timeout, socket_connect_timeout=storage_timeout)
+
+    logger.info(f"Rate limiting: storage {storage_uri.split('://')[0]}, strategy {strategy}, key {key}")
+    return Limiter(
+        key_func=key_funcs[key],
+        storage_uri=storage_uri,
+        storage_options=storage_options,
+        strategy=strategy,
+        key_prefix="gateway",
+        in_memory_fallback_enabled=True,
+        headers_enabled=False
+    )
@@ -0,0 +1,211 @@
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Tuple, Type
+
+from instrumentation import (
+    UPSTREAM_BREAKER_STATE, UPSTREAM_CONCURRENCY_LIMIT, UPSTREAM_IN_FLIGHT, UPSTREAM_SHED
+)
+
+BREAKER_CLOSED = "closed"
+BREAKER_HALF_OPEN = "half_open"
+BREAKER_OPEN = "open"
+
+# Значение метрики состояния предохранителя
+BREAKER_STATE_VALUES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+class UpstreamUnavailableError(Exception):
+    """Запрос к upstream'у отклонен без отправки (предохранитель или лимит параллельности)"""
+
+    def __init__(self, upstream: str, reason: str, status_code: int, retry_after: float):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold ошибок подряд upstream считается
+    недоступным (open) на reset_timeout секунд, запросы отклоняются сразу.
+    Затем пропускается один пробный запрос (half_open): успех закрывает
+    предохранитель, ошибка снова открывает его.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос (в half_open - только один пробный)"""
+        if self.state == BREAKER_OPEN:
+            if self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = BREAKER_HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == BREAKER_HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def retry_after(self) -> float:
+        """Секунды до следующей попытки при открытом предохранителе"""
+        if self.state != BREAKER_OPEN:
+            return 1.0
+        return max(self.reset_timeout - (self._clock() - self._opened_at), 1.0)
+
+    def cancel_probe(self):
+        """Пробный запрос не был отправлен - пробным может стать следующий"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state == BREAKER_OPEN:
+            # Ответ на запрос, отправленный до открытия, не закрывает предохранитель
+            return
+        self.failures = 0
+        self._probe_in_flight = False
+        self.state = BREAKER_CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == BREAKER_OPEN:
+            return
+        self._probe_in_flight = False
+        if self.state == BREAKER_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = BREAKER_OPEN
+            self._opened_at = self._clock()
+
+class AIMDLimiter:
+    """
+    Адаптивный лимит параллельных запросов (AIMD).
+
+    Быстрый успешный ответ (не дольше latency_target_ms) увеличивает лимит
+    на 1/limit, то есть примерно на 1 за "раунд" запросов; медленный ответ или
+    ошибка уменьшают его в backoff раз. Лимит находится в [min_limit, max_limit].
+
+    Уменьшение - не чаще одного раза за "окно": его вызывает только запрос,
+    начатый после предыдущего уменьшения. Иначе одна волна медленных ответов
+    на запросы, отправленные одновременно, сбросила бы лимит до min_limit.
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int,
+                 latency_target_ms: float, backoff: float = 0.9,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_ms = latency_target_ms
+        self.backoff = backoff
+        self._clock = clock
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._decreased_at = float("-inf")
+        self.in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency_ms: float, ok: bool):
+        self.in_flight -= 1
+        if ok and latency_ms <= self.latency_target_ms:
+            self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+            return
+        now = self._clock()
+        if now - latency_ms / 1000 < self._decreased_at:
+            # Запрос отправлен до прошлого уменьшения: перегрузка уже учтена
+            return
+        self._limit = max(math.floor(self._limit * self.backoff), self.min_limit)
+        self._decreased_at = now
+
+class UpstreamSlot:
+    """Результат запроса внутри UpstreamGuard.slot()"""
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self):
+        self.ok = False
+
+class UpstreamGuard:
+    """
+    Предохранитель и адаптивный лимит параллельности одного upstream'а.
+    Запрос сверх лимита или при открытом предохранителе отклоняется сразу
+    (UpstreamUnavailableError), не занимая соединение и не дожидаясь таймаута.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, limiter: AIMDLimiter):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+        self._export()
+
+    def _export(self):
+        UPSTREAM_BREAKER_STATE.labels(upstream=self.name).set(BREAKER_STATE_VALUES[self.breaker.state])
+        UPSTREAM_CONCURRENCY_LIMIT.labels(upstream=self.name).set(self.limiter.limit)
+        UPSTREAM_IN_FLIGHT.labels(upstream=self.name).set(self.limiter.in_flight)
+
+    def _reject(self, reason: str, status_code: int, retry_after: float) -> UpstreamUnavailableError:
+        UPSTREAM_SHED.labels(upstream=self.name, reason=reason).inc()
+        self._export()
+        return UpstreamUnavailableError(self.name, reason, status_code, retry_after)
+
+    def acquire(self):
+        if not self.breaker.allow():
+            raise self._reject("circuit_open", 503, self.breaker.retry_after())
+        if not self.limiter.try_acquire():
+            self.breaker.cancel_probe()
+            raise self._reject("concurrency_limit", 429, 1.0)
+        self._export()
+
+    def release(self, latency_ms: float, ok: bool):
+        """Освобождение места с учетом результата запроса"""
+        self.limiter.release(latency_ms, ok)
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self._export()
+
+    def abandon(self):
+        """Освобождение места без оценки upstream'а (запрос отменен клиентом)"""
+        self.limiter.in_flight -= 1
+        self.breaker.cancel_probe()
+        self._export()
+
+    @asynccontextmanager
+    async def slot(self, failures: Tuple[Type[BaseException], ...] = (Exception,)) -> AsyncIterator[UpstreamSlot]:
+        """
+        Место для одного запроса. Ошибкой upstream'а считаются исключения из
+        failures (таймаут, ошибка соединения) и ответы, отмеченные через
+        slot.fail() (502-504). Прочие исключения и отмена запроса клиентом
+        не влияют на оценку upstream'а.
+        """
+        self.acquire()
+        slot = UpstreamSlot()
+        started = time.perf_counter()
+        try:
+            yield slot
+        except failures:
+            self.release((time.perf_counter() - started) * 1000, False)
+            raise
+        except BaseException:
+            self.abandon()
+            raise
+        else:
+            self.release((time.perf_counter() - started) * 1000, slot.ok)
+
+def is_upstream_failure(status_code: int) -> bool:
+    """Ответы, означающие перегрузку или недоступность upstream'а"""
+    return status_code in (502, 503, 504)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули сервиса лежат плоско в каталоге сервиса (как при запуске uvicorn main:app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+
+@pytest.fixture
+def client():
+    main.app.dependency_overrides[main.require_auth] = lambda: {"username": "test"}
+    main.analytics_cache.clear()
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+@pytest.mark.parametrize("value,expected", [
+    ("1700000000", 1700000000.0),
+    ("2023-11-14T22:13:20Z", 1700000000.0),
+    ("", None),
+    ("yesterday", None),
+    ("nan", None),
+    ("inf", None),
+    ("-Infinity", None),
+])
+def test_parse_query_time(value, expected):
+    assert main.parse_query_time(value) == expected
+
+@pytest.mark.parametrize("end", ["inf", "nan", "-inf"])
+def test_non_finite_end_falls_back_to_open_bucket(client, end):
+    response = client.get("/analytics/events/count", params={"end": end})
+    assert response.status_code == 200
+
+    _, ttl = main.analytics_cache_key(request_for(end))
+    assert ttl == main.config.ANALYTICS_OPEN_BUCKET_TTL
+
+def request_for(end: str) -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/analytics/events/count",
+        "headers": [], "query_string": f"end={end}".encode()
+    })
+
+def test_closed_bucket_gets_closed_ttl():
+    _, ttl = main.analytics_cache_key(request_for("1000"))
+    assert ttl == main.config.ANALYTICS_CLOSED_BUCKET_TTL
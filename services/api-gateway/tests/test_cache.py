@@ -0,0 +1,99 @@
+import asyncio
+
+from cache import SingleFlight, TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, clock=clock)
+    cache.set("a", 1, ttl=5)
+
+    clock.now += 4.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_entries_have_individual_ttl():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, clock=clock)
+    cache.set("short", 1, ttl=1)
+    cache.set("long", 2, ttl=10)
+
+    clock.now += 2
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+def test_non_positive_ttl_is_not_stored():
+    cache = TTLCache(max_entries=10)
+    cache.set("a", 1, ttl=0)
+    cache.set("b", 1, ttl=-1)
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1  # "b" теперь самая давняя
+    cache.set("c", 3, ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+def test_overwrite_does_not_evict():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.set("a", 10, ttl=60)
+    assert len(cache) == 2
+    assert cache.get("a") == 10
+    assert cache.evictions == 0
+
+def test_delete_where_and_clear():
+    cache = TTLCache(max_entries=10)
+    for i in range(5):
+        cache.set(i, {"username": "bob" if i % 2 else "alice"}, ttl=60)
+
+    assert cache.delete_where(lambda value: value["username"] == "bob") == 2
+    assert len(cache) == 3
+    assert cache.clear() == 3
+    assert len(cache) == 0
+
+def test_hit_ratio_counts_expired_as_miss():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, clock=clock)
+    cache.set("a", 1, ttl=1)
+    cache.get("a")
+    clock.now += 1
+    cache.get("a")
+    cache.get("missing")
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.stats()["hit_ratio"] == round(1 / 3, 4)
+
+def test_single_flight_shares_one_load():
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", loader) for _ in range(5)))
+        assert len(flight) == 0
+        return results
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert [value for value, _ in results] == [1] * 5
+    assert sum(1 for _, shared in results if not shared) == 1
@@ -0,0 +1,91 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+MINIMUM_SIZE = 1024
+
+def chunks(count: int, size: int):
+    async def stream():
+        for _ in range(count):
+            yield b"a" * size
+    return stream()
+
+def make_client() -> TestClient:
+    routes = [
+        Route("/small", lambda request: Response(b"b" * 100)),
+        Route("/large", lambda request: Response(b"b" * 5000, headers={"ETag": '"v1"'})),
+        # Как passthrough /events: поток с Content-Length из upstream'а
+        Route("/stream-declared-small", lambda request: StreamingResponse(
+            chunks(1, 119), headers={"Content-Length": "119"}
+        )),
+        Route("/stream-small", lambda request: StreamingResponse(chunks(3, 100))),
+        Route("/stream-large", lambda request: StreamingResponse(chunks(30, 100))),
+        Route("/encoded", lambda request: Response(
+            gzip.compress(b"c" * 5000), headers={"Content-Encoding": "gzip"}
+        )),
+    ]
+    app = CompressionMiddleware(Starlette(routes=routes), minimum_size=MINIMUM_SIZE)
+    return TestClient(app)
+
+@pytest.fixture(scope="module")
+def client():
+    return make_client()
+
+def get(client: TestClient, path: str, accept_encoding: str = "gzip"):
+    return client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+@pytest.mark.parametrize("path,size", [
+    ("/small", 100),
+    ("/stream-declared-small", 119),
+    ("/stream-small", 300),
+])
+def test_responses_below_threshold_are_not_compressed(client, path, size):
+    response = get(client, path)
+    assert "content-encoding" not in response.headers
+    assert len(response.content) == size
+
+def test_declared_small_stream_keeps_content_length(client):
+    response = get(client, "/stream-declared-small")
+    assert response.headers["content-length"] == "119"
+
+def test_large_response_is_compressed_with_weak_etag(client):
+    response = get(client, "/large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < 5000
+    assert response.headers["etag"] == 'W/"v1"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.content == b"b" * 5000
+
+def test_large_stream_is_compressed_once_threshold_is_reached(client):
+    response = get(client, "/stream-large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == b"a" * 3000
+
+def test_already_encoded_response_is_passed_through(client):
+    response = get(client, "/encoded")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"c" * 5000
+
+def test_no_compression_without_accept_encoding(client):
+    response = get(client, "/large", accept_encoding="identity")
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+@pytest.mark.parametrize("header,expected", [
+    ("gzip", "gzip"),
+    ("br, gzip", "br"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header, ("br", "gzip")) == expected
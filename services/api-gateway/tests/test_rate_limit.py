@@ -0,0 +1,68 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+redis = pytest.importorskip("redis")
+
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+
+from rate_limit import BatchedRedisStorage, create_limiter
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis, "from_url", lambda url, **options: fakeredis.FakeRedis(server=server))
+    return server
+
+def make_storage() -> BatchedRedisStorage:
+    # Фоновая синхронизация не успевает сработать - sync() вызывается тестом
+    return BatchedRedisStorage("batched+redis://localhost:6379/0", sync_interval=3600)
+
+def test_limit_is_checked_locally_before_sync(server):
+    storage = make_storage()
+    limiter = FixedWindowRateLimiter(storage)
+    item = parse("3/minute")
+
+    assert [limiter.hit(item, "client") for _ in range(4)] == [True, True, True, False]
+    assert storage.redis.get(item.key_for("client")) == 0
+
+    storage.sync()
+    assert storage.redis.get(item.key_for("client")) == 4
+    assert storage.get(item.key_for("client")) == 4
+
+def test_replicas_see_each_other_after_sync(server):
+    first, second = make_storage(), make_storage()
+    item = parse("5/minute")
+    key = item.key_for("client")
+
+    for _ in range(3):
+        FixedWindowRateLimiter(first).hit(item, "client")
+    first.sync()
+    second.incr(key, item.get_expiry())
+    second.sync()
+    first.sync()
+
+    assert first.get(key) == second.get(key) == 4
+    assert FixedWindowRateLimiter(first).hit(item, "client")
+    assert not FixedWindowRateLimiter(first).hit(item, "client")
+
+def test_failed_sync_keeps_deltas(server):
+    storage = make_storage()
+    storage.incr("key", 60, amount=2)
+
+    def unavailable(*args, **kwargs):
+        raise redis.ConnectionError("down")
+
+    get_connection = storage.redis.get_connection
+    storage.redis.get_connection = unavailable
+    with pytest.raises(redis.ConnectionError):
+        storage.sync()
+    assert storage.get("key") == 2
+
+    storage.redis.get_connection = get_connection
+    storage.sync()
+    assert storage.redis.get("key") == 2
+
+def test_batched_storage_requires_fixed_window():
+    with pytest.raises(ValueError):
+        create_limiter("batched+redis://localhost:6379/0", "moving-window", "ip", verify_token=lambda token: None)
@@ -0,0 +1,38 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main.config, "MAX_BATCH_BODY_BYTES", 100)
+    monkeypatch.setattr(main.config, "MAX_EVENT_BODY_BYTES", 100)
+    monkeypatch.setattr(main.config, "EVENTS_PASSTHROUGH", True)
+    main.limiter.reset()
+    return TestClient(main.app)
+
+def test_chunked_batch_over_limit_is_rejected(client):
+    def body():
+        for _ in range(20):
+            yield b"x" * 10
+
+    assert client.post("/events/batch", content=body()).status_code == 413
+
+def test_chunked_passthrough_whitespace_over_limit_is_rejected(client):
+    def body():
+        for _ in range(20):
+            yield b" " * 10
+
+    assert client.post("/events", content=body()).status_code == 413
+
+def test_declared_batch_over_limit_is_rejected(client):
+    assert client.post("/events/batch", content=b"x" * 200).status_code == 413
+
+@pytest.mark.parametrize("value", ["abc", "-1"])
+def test_invalid_content_length_is_rejected(client, value):
+    response = client.post(
+        "/events/batch",
+        content=b"[]",
+        headers={"Content-Length": value}
+    )
+    assert response.status_code == 400
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from resilience import (
+    AIMDLimiter, BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN,
+    CircuitBreaker, UpstreamGuard, UpstreamUnavailableError
+)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_CLOSED
+    breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+    assert not breaker.allow()
+
+def test_success_resets_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_CLOSED
+
+def test_half_open_allows_single_probe(breaker, clock):
+    trip(breaker)
+    clock.now += 9.9
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(1.0)
+
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert not breaker.allow()
+
+def test_probe_success_closes(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+def test_probe_failure_reopens_for_full_timeout(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+    clock.now += 9
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(1.0)
+    clock.now += 1
+    assert breaker.allow()
+
+def test_cancelled_probe_lets_next_request_probe(breaker, clock):
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.cancel_probe()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+def test_late_success_does_not_close_open_breaker(breaker):
+    trip(breaker)
+    breaker.record_success()
+    assert breaker.state == BREAKER_OPEN
+    assert not breaker.allow()
+
+def test_aimd_limit_grows_on_fast_and_shrinks_on_slow(clock):
+    limiter = AIMDLimiter(initial_limit=4, min_limit=2, max_limit=8, latency_target_ms=100, clock=clock)
+    for _ in range(4):
+        assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    for _ in range(4):
+        limiter.release(latency_ms=10, ok=True)
+    # +1/limit на каждый быстрый ответ: примерно +1 за раунд
+    assert limiter.limit == 4
+    limiter.try_acquire()
+    limiter.release(latency_ms=10, ok=True)
+    assert limiter.limit == 5
+
+    for _ in range(20):
+        limiter.try_acquire()
+        clock.now += 0.5
+        limiter.release(latency_ms=500, ok=True)
+    assert limiter.limit == 2
+
+def test_aimd_decreases_once_per_window_of_concurrent_requests(clock):
+    limiter = AIMDLimiter(initial_limit=20, min_limit=1, max_limit=20, latency_target_ms=100, clock=clock)
+    for _ in range(20):
+        assert limiter.try_acquire()
+    clock.now += 0.5
+    # Все 20 запросов отправлены до уменьшения: лимит снижается один раз
+    for _ in range(20):
+        limiter.release(latency_ms=500, ok=False)
+    assert limiter.limit == 18
+    assert limiter.in_flight == 0
+
+    # Запрос, начатый после уменьшения, снова может его вызвать
+    limiter.try_acquire()
+    clock.now += 0.5
+    limiter.release(latency_ms=500, ok=True)
+    assert limiter.limit == 16
+
+def test_guard_rejects_with_status_and_retry_after(clock):
+    guard = UpstreamGuard(
+        "test",
+        CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock),
+        AIMDLimiter(initial_limit=1, min_limit=1, max_limit=1, latency_target_ms=100)
+    )
+
+    async def run():
+        async with guard.slot():
+            with pytest.raises(UpstreamUnavailableError) as shed:
+                async with guard.slot():
+                    pass
+            assert shed.value.status_code == 429
+
+        with pytest.raises(ConnectionError):
+            async with guard.slot(failures=(ConnectionError,)):
+                raise ConnectionError()
+
+        with pytest.raises(UpstreamUnavailableError) as rejected:
+            async with guard.slot():
+                pass
+        assert rejected.value.status_code == 503
+        assert rejected.value.retry_after == pytest.approx(30)
+
+    asyncio.run(run())
+    assert guard.limiter.in_flight == 0
@@ -0,0 +1,97 @@
+import time
+from typing import Any, Dict, Optional
+
+from jose import JWTError, jwk, jwt
+
+from cache import TTLCache
+from instrumentation import JWT_VERIFICATIONS
+
+# Симметричные алгоритмы: подпись и проверка одним секретом
+HMAC_ALGORITHMS = ("HS256", "HS384", "HS512")
+
+def read_key(value: str, path: str) -> str:
+    """Ключ из переменной окружения или из файла (PEM), если задан путь"""
+    if path:
+        with open(path) as key_file:
+            return key_file.read()
+    return value
+
+class TokenVerifier:
+    """
+    Локальная проверка JWT с кешем проверенных токенов.
+
+    Ключ проверки разбирается один раз при создании (jwk.construct), а не при
+    каждом jwt.decode. Алгоритм задается конфигурацией: HS* - общий секрет
+    с auth-сервисом, RS*/ES* - публичный ключ (подписывать токены gateway тогда
+    может, только если передан закрытый ключ).
+
+    Проверенный токен хранится в LRU вместе с claims до своего exp (не дольше
+    cache_ttl), поэтому повторные запросы с тем же токеном не проверяют
+    подпись и не разбирают JSON заново.
+    """
+
+    def __init__(self, algorithm: str, verification_key: str, signing_key: Optional[str] = None,
+                 cache_max_entries: int = 10000, cache_ttl: float = 300.0):
+        self.algorithm = algorithm
+        self.cache_ttl = cache_ttl
+        self._verification_key = jwk.construct(verification_key, algorithm)
+        self._signing_key = signing_key
+        self._cache = TTLCache(max_entries=cache_max_entries)
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims валидного токена или None. Возвращаемый словарь общий - не изменять"""
+        claims = self._cache.get(token)
+        if claims is not None:
+            JWT_VERIFICATIONS.labels(result="cached").inc()
+            return claims
+
+        try:
+            claims = jwt.decode(token, self._verification_key, algorithms=[self.algorithm])
+        except JWTError:
+            JWT_VERIFICATIONS.labels(result="invalid").inc()
+            return None
+
+        JWT_VERIFICATIONS.labels(result="verified").inc()
+        ttl = self.cache_ttl
+        if claims.get("exp") is not None:
+            ttl = min(ttl, claims["exp"] - time.time())
+        self._cache.set(token, claims, ttl)
+        return claims
+
+    def sign(self, claims: Dict[str, Any]) -> str:
+        if self._signing_key is None:
+            raise RuntimeError(f"No signing key configured for {self.algorithm}")
+        return jwt.encode(claims, self._signing_key, algorithm=self.algorithm)
+
+    def invalidate(self, username: Optional[str] = None, user_id: Optional[int] = None) -> int:
+        """Удаление кешированных claims пользователя (без аргументов - всех); возвращает число записей"""
+        if username is None and user_id is None:
+            return self._cache.clear()
+        return self._cache.delete_where(
+            lambda claims: (username is not None and claims.get("sub") == username)
+            or (user_id is not None and claims.get("user_id") == user_id)
+        )
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+def create_token_verifier(algorithm: str, secret_key: str, public_key: str = "",
+                          private_key: str = "", cache_max_entries: int = 10000,
+                          cache_ttl: float = 300.0) -> TokenVerifier:
+    """TokenVerifier для алгоритма из конфигурации: HS* - секрет, иначе пара ключей"""
+    if algorithm in HMAC_ALGORITHMS:
+        verification_key, signing_key = secret_key, secret_key
+    else:
+        if not public_key:
+            raise ValueError(f"JWT_PUBLIC_KEY or JWT_PUBLIC_KEY_FILE is required for {algorithm}")
+        verification_key, signing_key = public_key, private_key or None
+    return TokenVerifier(
+        algorithm,
+        verification_key,
+        signing_key=signing_key,
+        cache_max_entries=cache_max_entries,
+        cache_ttl=cache_ttl
+    )
@@ -0,0 +1,152 @@
+import logging
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from resilience import AIMDLimiter, CircuitBreaker, UpstreamGuard, is_upstream_failure
+
+logger = logging.getLogger(__name__)
+
+# Исключения, означающие недоступность upstream'а (таймауты, ошибки соединения и протокола)
+UPSTREAM_FAILURES = (httpx.TransportError,)
+
+def http2_available() -> bool:
+    """HTTP/2 в httpx требует пакет h2 (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class UpstreamClients:
+    """
+    Реестр долгоживущих httpx.AsyncClient: свой пул соединений с keep-alive
+    на каждый upstream (auth, collector, analytics).
+
+    Клиенты создаются при старте приложения и закрываются при остановке,
+    поэтому запросы переиспользуют TCP-соединения вместо установки нового
+    соединения и пула на каждый проксируемый запрос.
+    HTTP/2 включается для https-upstream'ов: без TLS (ALPN) httpx
+    договаривается только о HTTP/1.1.
+    Если задан guard_factory, запросы к каждому upstream'у проходят через его
+    UpstreamGuard (предохранитель и адаптивный лимит параллельности).
+    """
+
+    def __init__(self, limits: httpx.Limits, timeout: httpx.Timeout, http2: bool = True,
+                 guard_factory: Optional[Callable[[str], UpstreamGuard]] = None):
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+        if http2 and not http2_available():
+            logger.warning("HTTP/2 unavailable (h2 is not installed), using HTTP/1.1 for upstreams")
+            self.http2 = False
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._guard_factory = guard_factory
+        self._guards: Dict[str, UpstreamGuard] = {}
+
+    def start(self, base_urls: Iterable[str]):
+        """Создание клиентов для известных upstream'ов при старте приложения"""
+        for base_url in base_urls:
+            self.get(base_url)
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        """Клиент upstream'а (создается при первом обращении, если не создан при старте)"""
+        client = self._clients.get(base_url)
+        if client is None:
+            http2 = self.http2 and urlsplit(base_url).scheme == "https"
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=http2
+            )
+            self._clients[base_url] = client
+            logger.info(f"Upstream client created for {base_url} (http2: {http2})")
+        return client
+
+    def guard(self, base_url: str) -> Optional[UpstreamGuard]:
+        """Предохранитель и лимит upstream'а (None, если защита не настроена)"""
+        if self._guard_factory is None:
+            return None
+        guard = self._guards.get(base_url)
+        if guard is None:
+            guard = self._guard_factory(urlsplit(base_url).netloc or base_url)
+            self._guards[base_url] = guard
+        return guard
+
+    async def request(self, base_url: str, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Запрос к upstream'у через его пул соединений.
+        Если upstream перегружен или недоступен, выбрасывается UpstreamUnavailableError без запроса.
+        """
+        client = self.get(base_url)
+        guard = self.guard(base_url)
+        if guard is None:
+            return await client.request(method, path, **kwargs)
+        async with guard.slot(UPSTREAM_FAILURES) as slot:
+            response = await client.request(method, path, **kwargs)
+            if is_upstream_failure(response.status_code):
+                slot.fail()
+            return response
+
+    async def stream(self, base_url: str, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Запрос к upstream'у без чтения тела ответа: тело читается через
+        response.aiter_raw(), после чего ответ нужно закрыть (response.aclose()).
+        Лимит параллельности учитывает запрос до получения заголовков ответа.
+        """
+        client = self.get(base_url)
+        request = client.build_request(method, path, **kwargs)
+        guard = self.guard(base_url)
+        if guard is None:
+            return await client.send(request, stream=True)
+        async with guard.slot(UPSTREAM_FAILURES) as slot:
+            response = await client.send(request, stream=True)
+            if is_upstream_failure(response.status_code):
+                slot.fail()
+            return response
+
+    async def close(self):
+        """Закрытие всех пулов соединений"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+def create_upstream_clients(max_connections: int, max_keepalive_connections: int,
+                            keepalive_expiry: float, connect_timeout: float,
+                            read_timeout: float, pool_timeout: float,
+                            http2: bool = True,
+                            breaker_failures: int = 5, breaker_reset_seconds: float = 10.0,
+                            concurrency_initial: int = 20, concurrency_min: int = 2,
+                            latency_target_ms: float = 250.0) -> UpstreamClients:
+    """
+    Реестр клиентов с лимитами пула и таймаутами из конфигурации.
+    Адаптивный лимит параллельности не превышает размер пула (max_connections).
+    """
+    def guard_factory(name: str) -> UpstreamGuard:
+        return UpstreamGuard(
+            name,
+            CircuitBreaker(failure_threshold=breaker_failures, reset_timeout=breaker_reset_seconds),
+            AIMDLimiter(
+                initial_limit=concurrency_initial,
+                min_limit=concurrency_min,
+                max_limit=max_connections,
+                latency_target_ms=latency_target_ms
+            )
+        )
+
+    return UpstreamClients(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            read_timeout,
+            connect=connect_timeout,
+            pool=pool_timeout
+        ),
+        http2=http2,
+        guard_factory=guard_factory
+    )
@@ -1,36 +1,44 @@
 import os
+import logging
 from datetime import datetime, timedelta
 from typing import Optional
 
+import httpx
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 
 from models import User
 from schemas import TokenData
-from database import get_db
+from database import async_session
+from user_cache import UserSnapshot, user_cache
+from password_hashing import password_hasher
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRATION_HOURS", "24")) * 60
 
+# Gateway token cache invalidation hook (one URL per gateway replica)
+GATEWAY_INTERNAL_URLS = [url for url in os.getenv("GATEWAY_INTERNAL_URLS", "").split(",") if url]
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "")
+GATEWAY_INVALIDATION_TIMEOUT = float(os.getenv("GATEWAY_INVALIDATION_TIMEOUT", "2"))
+
 # Security scheme
 security = HTTPBearer(auto_error=False)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plaintext password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a plaintext password against its hash (on the hashing pool)."""
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    """Hash a plaintext password."""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Hash a plaintext password (on the hashing pool)."""
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
@@ -78,17 +86,92 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> O
     user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
     if not user.is_active:
         return None
     return user
 
+async def record_login(user_id: int, username: str):
+    """
+    Set last_login with a single UPDATE on its own session.
+
+    Runs as a background task after the /login response is sent, so a slow
+    write never delays the token; a failure is logged and the login stands.
+    """
+    try:
+        async with async_session() as session:
+            result = await session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(last_login=datetime.utcnow())
+                .returning(User.last_login, User.updated_at)
+            )
+            row = result.one_or_none()
+            await session.commit()
+    except Exception as e:
+        logger.error(f"Failed to record login for user {username}: {e}")
+        return
+    # Keep the cached snapshot warm: the next /verify should not go to the database
+    if row is not None:
+        user_cache.update(username, last_login=row.last_login, updated_at=row.updated_at)
+
+async def invalidate_gateway_token_cache(user_id: int, username: str):
+    """
+    Drop a user's cached /auth/verify results and token claims in every gateway.
+
+    Scheduled as a background task after a user is deactivated or changed, so the
+    change is visible through the gateway before TOKEN_CACHE_TTL_SECONDS runs out. Best effort:
+    a gateway that cannot be reached still expires its entries by TTL.
+    """
+    if not GATEWAY_INTERNAL_URLS or not INTERNAL_API_KEY:
+        return
+    async with httpx.AsyncClient(timeout=GATEWAY_INVALIDATION_TIMEOUT) as client:
+        for url in GATEWAY_INTERNAL_URLS:
+            try:
+                response = await client.post(
+                    f"{url.rstrip('/')}/internal/token-cache/invalidate",
+                    json={"user_id": user_id, "username": username},
+                    headers={"X-Internal-Key": INTERNAL_API_KEY}
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning(f"Gateway token cache invalidation failed for {url}: {e}")
+
+def duplicate_user_field(error: IntegrityError) -> Optional[str]:
+    """Map a unique violation on users to the offending field ("username"/"email")."""
+    # asyncpg reports the violated index name; other drivers only a message
+    cause = getattr(error.orig, "__cause__", None)
+    detail = getattr(cause, "constraint_name", None) or str(error.orig)
+    for field in ("username", "email"):
+        if field in detail:
+            return field
+    return None
+
+async def get_user_snapshot(username: str) -> Optional[UserSnapshot]:
+    """Get a user snapshot from the cache, loading it from the database on a miss."""
+    snapshot = user_cache.get(username)
+    if snapshot is not None:
+        return snapshot
+    
+    async with async_session() as session:
+        user = await get_user_by_username(session, username)
+    if user is None:
+        return None
+    
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.put(snapshot)
+    return snapshot
+
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """Get current user from JWT token."""
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserSnapshot:
+    """
+    Get current user from JWT token.
+    
+    Token claims plus the user snapshot cache are enough on a hit, so no
+    database session is opened for repeated requests of the same user.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -102,10 +185,17 @@ async def get_current_user(
     if token_data is None:
         raise credentials_exception
     
-    user = await get_user_by_username(db, token_data.username)
+    user = await get_user_snapshot(token_data.username)
     if user is None:
         raise credentials_exception
     
+    # The cached snapshot may belong to a previous account with the same username
+    if token_data.user_id is not None and token_data.user_id != user.id:
+        user_cache.invalidate(username=user.username)
+        user = await get_user_snapshot(token_data.username)
+        if user is None or user.id != token_data.user_id:
+            raise credentials_exception
+    
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -114,18 +204,18 @@ async def get_current_user(
     
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: UserSnapshot = Depends(get_current_user)) -> UserSnapshot:
     """Get current active user."""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def create_initial_user() -> dict:
+async def create_initial_user() -> dict:
     """Create data for initial admin user."""
     return {
         "username": "admin",
         "email": "admin@analytics-dashboard.com",
-        "hashed_password": get_password_hash("admin"),
+        "hashed_password": await get_password_hash("admin"),
         "is_active": True,
         "is_superuser": True
     }
\ No newline at end of file
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Login latency benchmark: bcrypt on the event loop vs. the bounded hashing pool.
+
+In-process mode (default) runs concurrent password verifications the way
+/login does, while a probe coroutine measures how long a cheap request
+(like /health) waits for the event loop:
+
+    inline  - passlib called directly in the coroutine (previous behaviour)
+    pool    - PasswordHasher (password_hashing.py)
+
+HTTP mode sends concurrent /login requests to a running auth service.
+
+Examples:
+    python bench_login.py
+    python bench_login.py --mode pool --logins 200 --concurrency 32 --rounds 10
+    python bench_login.py --url http://localhost:8001 --username admin --password admin
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+def percentiles(values: List[float]) -> dict:
+    if len(values) < 2:
+        value = round(values[0], 1) if values else 0.0
+        return {"p50_ms": value, "p99_ms": value, "max_ms": value}
+    cuts = statistics.quantiles(values, n=100)
+    return {"p50_ms": round(cuts[49], 1), "p99_ms": round(cuts[98], 1), "max_ms": round(max(values), 1)}
+
+async def probe_loop(stop: asyncio.Event, interval: float, delays: List[float]):
+    """Event loop lag seen by a cheap request scheduled every `interval` seconds."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        delays.append((time.perf_counter() - started - interval) * 1000)
+
+async def run_in_process(mode: str, logins: int, concurrency: int, rounds: int, workers: int) -> dict:
+    from password_hashing import PasswordHasher
+
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_queue=logins, queue_timeout=600)
+    hashed = hasher.context.hash("bench-password")
+
+    if mode == "inline":
+        async def verify():
+            return hasher.context.verify("bench-password", hashed)
+    else:
+        async def verify():
+            return await hasher.verify("bench-password", hashed)
+
+    latencies: List[float] = []
+    remaining = logins
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await verify()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    probe_delays: List[float] = []
+    probe = asyncio.create_task(probe_loop(stop, 0.01, probe_delays))
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    hasher.shutdown()
+
+    return {
+        "mode": mode,
+        "rounds": rounds,
+        "workers": workers if mode == "pool" else 0,
+        "logins": logins,
+        "concurrency": concurrency,
+        "logins_per_second": round(logins / elapsed, 1),
+        "login": percentiles(latencies),
+        "event_loop_lag": percentiles(probe_delays),
+    }
+
+async def run_http(url: str, username: str, password: str, logins: int, concurrency: int) -> dict:
+    import httpx
+
+    latencies: List[float] = []
+    statuses = {}
+    remaining = logins
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as http:
+        async def client():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                response = await http.post("/login", json={"username": username, "password": password})
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "url": url,
+        "logins": logins,
+        "concurrency": concurrency,
+        "logins_per_second": round(logins / elapsed, 1),
+        "status_codes": statuses,
+        "login": percentiles(latencies),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Login / bcrypt latency benchmark")
+    parser.add_argument("--mode", nargs="+", choices=["inline", "pool"], default=["inline", "pool"])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=4, help="hashing pool size")
+    parser.add_argument("--url", help="benchmark a running auth service over HTTP instead")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    args = parser.parse_args()
+
+    if args.url:
+        print(json.dumps(await run_http(args.url, args.username, args.password, args.logins, args.concurrency), indent=2))
+        return
+
+    for mode in args.mode:
+        result = await run_in_process(mode, args.logins, args.concurrency, args.rounds, args.workers)
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,18 @@
 import os
+import time
+import logging
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 from dotenv import load_dotenv
 
+from instrumentation import DB_STATEMENT_SECONDS, DB_POOL_CONNECTIONS
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database URL
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -16,13 +23,80 @@ DATABASE_URL = os.getenv(
     f"{os.getenv('POSTGRES_DB', 'analytics_auth')}"
 )
 
+# Engine and pool settings
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+STATEMENT_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"}
+
 # Create async engine
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,  # Set to False in production
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
     future=True
 )
 
+def statement_operation(statement: str) -> str:
+    """Low-cardinality label for a SQL statement: its leading keyword."""
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword.lower() if keyword in STATEMENT_OPERATIONS else "other"
+
+def instrument_engine(engine):
+    """
+    Statement latency histogram and pool saturation gauges via SQLAlchemy events.
+
+    Pool gauges are refreshed on every checkout/checkin, so in_use approaching
+    size + max overflow means requests are about to wait for a connection.
+    """
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+
+    def update_pool_gauges():
+        DB_POOL_CONNECTIONS.labels(state="in_use").set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels(state="idle").set(pool.checkedin())
+        DB_POOL_CONNECTIONS.labels(state="overflow").set(max(pool.overflow(), 0))
+        DB_POOL_CONNECTIONS.labels(state="capacity").set(pool.size() + DB_MAX_OVERFLOW)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["statement_started"].pop()
+        elapsed = time.perf_counter() - started
+        DB_STATEMENT_SECONDS.labels(operation=statement_operation(statement)).observe(elapsed)
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            logger.warning(f"Slow query ({elapsed * 1000:.0f} ms): {statement[:200]}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("statement_started") if context.connection else None
+        if started:
+            started.pop()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        update_pool_gauges()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        update_pool_gauges()
+
+    update_pool_gauges()
+
+instrument_engine(engine)
+
 # Create async session maker
 async_session = async_sessionmaker(
     engine,
@@ -47,6 +121,10 @@ async def create_tables():
     from models import Base
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips existing tables; add indexes introduced later
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
 
 # Health check
 async def check_db_health():
@@ -0,0 +1,63 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# With PROMETHEUS_MULTIPROC_DIR set (before prometheus_client is imported),
+# /metrics aggregates the values of all workers via MultiProcessCollector.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+USER_CACHE_REQUESTS = Counter(
+    "auth_user_cache_requests_total",
+    "User snapshot cache lookups",
+    ["result"]
+)
+USER_CACHE_INVALIDATIONS = Counter(
+    "auth_user_cache_invalidations_total",
+    "User snapshots dropped because the user changed"
+)
+USER_CACHE_ENTRIES = Gauge(
+    "auth_user_cache_entries",
+    "Entries in the user snapshot cache",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "auth_password_hash_seconds",
+    "bcrypt hash/verify time on the hashing pool (excluding queue wait)",
+    ["operation"],
+    buckets=(0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "auth_password_hash_queue_depth",
+    "Hashing requests waiting for a free worker",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "auth_password_hash_rejected_total",
+    "Hashing requests rejected because the queue was full or the wait timed out",
+    ["reason"]
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "auth_db_statement_seconds",
+    "SQL statement execution time",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "auth_db_pool_connections",
+    "Database pool connections by state (in_use, idle, overflow, capacity)",
+    ["state"],
+    multiprocess_mode="livesum"
+)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus exposition of the auth service metrics."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,25 +1,32 @@
 import os
+import time
 import logging
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 
 from models import User, Base
 from schemas import (
-    UserCreate, UserResponse, UserLogin, Token, MessageResponse, 
+    UserCreate, UserUpdate, UserResponse, UserLogin, Token, MessageResponse, 
     HealthResponse, UserStatsResponse
 )
 from database import get_db, create_tables, check_db_health, engine
 from auth_utils import (
     authenticate_user, create_access_token, get_current_active_user,
     get_user_by_username, get_user_by_email, get_password_hash,
-    create_initial_user, ACCESS_TOKEN_EXPIRE_MINUTES
+    create_initial_user, record_login, duplicate_user_field,
+    invalidate_gateway_token_cache, ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from user_cache import UserSnapshot, user_cache
+from password_hashing import PasswordHasherBusyError, password_hasher
+from instrumentation import USER_CACHE_ENTRIES, render_metrics
 
 # Load environment variables
 load_dotenv()
@@ -31,6 +38,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# /stats is an admin dashboard widget: a few seconds of staleness is fine
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "30"))
+USERS_PAGE_MAX_LIMIT = int(os.getenv("USERS_PAGE_MAX_LIMIT", "1000"))
+
+stats_cache: Optional[Tuple[float, UserStatsResponse]] = None
+
+def invalidate_stats_cache():
+    global stats_cache
+    stats_cache = None
+
 # FastAPI app
 app = FastAPI(
     title="Analytics Auth Service",
@@ -45,6 +62,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id"],
 )
 
 # Startup event
@@ -63,7 +81,7 @@ async def startup_event():
             admin_user = result.scalar_one_or_none()
             
             if not admin_user:
-                initial_user_data = create_initial_user()
+                initial_user_data = await create_initial_user()
                 admin_user = User(**initial_user_data)
                 session.add(admin_user)
                 await session.commit()
@@ -75,6 +93,21 @@ async def startup_event():
             logger.error(f"Error creating initial user: {e}")
             await session.rollback()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Wait for running password hashes to finish."""
+    password_hasher.shutdown()
+
+@app.exception_handler(PasswordHasherBusyError)
+async def password_hasher_busy_handler(request, exc: PasswordHasherBusyError):
+    """Shed login/registration load instead of queueing behind bcrypt."""
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service busy, retry later"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Health check
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -86,47 +119,56 @@ async def health_check():
         database=db_healthy
     )
 
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    """Prometheus metrics endpoint."""
+    USER_CACHE_ENTRIES.set(len(user_cache))
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
 # Authentication endpoints
 @app.post("/register", response_model=UserResponse)
 async def register(user_create: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user."""
     logger.info(f"Registration attempt for user: {user_create.username}")
     
-    # Check if username already exists
-    existing_user = await get_user_by_username(db, user_create.username)
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
+    # One INSERT ... RETURNING; the unique indexes on username and email
+    # reject duplicates atomically instead of check-then-insert
+    hashed_password = await get_password_hash(user_create.password)
+    try:
+        result = await db.execute(
+            insert(User)
+            .values(
+                username=user_create.username,
+                email=user_create.email,
+                hashed_password=hashed_password,
+                is_active=True,
+                is_superuser=False
+            )
+            .returning(User)
         )
-    
-    # Check if email already exists
-    existing_email = await get_user_by_email(db, user_create.email)
-    if existing_email:
+        db_user = result.scalar_one()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        field = duplicate_user_field(e)
+        if field is None:
+            raise
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail=f"{field.capitalize()} already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(user_create.password)
-    db_user = User(
-        username=user_create.username,
-        email=user_create.email,
-        hashed_password=hashed_password,
-        is_active=True,
-        is_superuser=False
-    )
-    
-    db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
-    
+    invalidate_stats_cache()
     logger.info(f"User {user_create.username} registered successfully")
     return db_user
 
 @app.post("/login", response_model=Token)
-async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
+async def login(
+    user_login: UserLogin,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
     """Authenticate user and return JWT token."""
     logger.info(f"Login attempt for user: {user_login.username}")
     
@@ -138,9 +180,10 @@ async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    await db.commit()
+    # Cache the snapshot for the /verify calls that follow; last_login is
+    # written after the response is sent
+    user_cache.put(UserSnapshot.from_user(user))
+    background_tasks.add_task(record_login, user.id, user.username)
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -156,38 +199,49 @@ async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
     )
 
 @app.get("/verify", response_model=UserResponse)
-async def verify_token(current_user: User = Depends(get_current_active_user)):
-    """Verify JWT token and return current user info."""
+async def verify_token(current_user: UserSnapshot = Depends(get_current_active_user)):
+    """Verify JWT token and return current user info (from token claims and the user cache)."""
     return current_user
 
 @app.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_info(current_user: UserSnapshot = Depends(get_current_active_user)):
     """Get current user information."""
     return current_user
 
 # User management endpoints
 @app.get("/users", response_model=List[UserResponse])
 async def get_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(get_current_active_user),
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return users with id greater than this (keyset cursor)"),
+    limit: int = Query(100, ge=1, le=USERS_PAGE_MAX_LIMIT),
+    current_user: UserSnapshot = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get list of users (admin only)."""
+    """
+    Get list of users ordered by id (admin only).
+
+    Keyset pagination: pass the X-Next-After-Id header of a page as after_id
+    to get the next one. Unlike OFFSET, the cost of a page does not grow with
+    its position in the table.
+    """
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
     
-    result = await db.execute(select(User).offset(skip).limit(limit))
+    result = await db.execute(
+        select(User).where(User.id > after_id).order_by(User.id).limit(limit)
+    )
     users = result.scalars().all()
+    if len(users) == limit:
+        response.headers["X-Next-After-Id"] = str(users[-1].id)
     return users
 
 @app.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
-    current_user: User = Depends(get_current_active_user),
+    current_user: UserSnapshot = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get user by ID."""
@@ -209,10 +263,83 @@ async def get_user(
     
     return user
 
+@app.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: int,
+    user_update: UserUpdate,
+    background_tasks: BackgroundTasks,
+    current_user: UserSnapshot = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Update a user (own profile, or any user for superusers; is_active is superuser only)."""
+    if user_id != current_user.id and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    if user_update.is_active is not None and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only superusers can activate or deactivate users"
+        )
+    
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    if user_update.username is not None and user_update.username != user.username:
+        if await get_user_by_username(db, user_update.username):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already registered"
+            )
+    if user_update.email is not None and user_update.email != user.email:
+        if await get_user_by_email(db, user_update.email):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+    
+    previous_username = user.username
+    changes = user_update.model_dump(exclude_none=True, exclude={"password"})
+    for field, value in changes.items():
+        setattr(user, field, value)
+    if user_update.password is not None:
+        user.hashed_password = await get_password_hash(user_update.password)
+        changes["password"] = True
+    
+    # The checks above can race with a concurrent update or registration;
+    # the unique indexes have the final say
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        field = duplicate_user_field(e)
+        if field is None:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{field.capitalize()} already registered"
+        )
+    await db.refresh(user)
+    # Deactivation and profile changes must be visible on the next request;
+    # the gateway is notified after the response so its latency stays off it
+    user_cache.invalidate(username=previous_username)
+    background_tasks.add_task(invalidate_gateway_token_cache, user.id, previous_username)
+    if "is_active" in changes:
+        invalidate_stats_cache()
+    
+    logger.info(f"User {user.username} updated: {', '.join(sorted(changes)) or 'no changes'}")
+    return user
+
 # Statistics endpoint
 @app.get("/stats", response_model=UserStatsResponse)
 async def get_user_stats(
-    current_user: User = Depends(get_current_active_user),
+    current_user: UserSnapshot = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get user statistics (admin only)."""
@@ -222,26 +349,30 @@ async def get_user_stats(
             detail="Not enough permissions"
         )
     
-    # Get total users
-    total_result = await db.execute(select(func.count(User.id)))
-    total_users = total_result.scalar()
+    global stats_cache
+    now = time.monotonic()
+    if stats_cache is not None and stats_cache[0] > now:
+        return stats_cache[1]
     
-    # Get active users
-    active_result = await db.execute(select(func.count(User.id)).where(User.is_active == True))
-    active_users = active_result.scalar()
-    
-    # Get recent registrations (last 7 days)
+    # Total, active and recent (last 7 days) users in one scan via FILTER
     week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_result = await db.execute(
-        select(func.count(User.id)).where(User.created_at >= week_ago)
+    result = await db.execute(
+        select(
+            func.count(User.id),
+            func.count(User.id).filter(User.is_active == True),
+            func.count(User.id).filter(User.created_at >= week_ago),
+        )
     )
-    recent_registrations = recent_result.scalar()
+    total_users, active_users, recent_registrations = result.one()
     
-    return UserStatsResponse(
+    stats = UserStatsResponse(
         total_users=total_users,
         active_users=active_users,
         recent_registrations=recent_registrations
     )
+    if STATS_CACHE_TTL_SECONDS > 0:
+        stats_cache = (now + STATS_CACHE_TTL_SECONDS, stats)
+    return stats
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from passlib.context import CryptContext
+
+from instrumentation import PASSWORD_HASH_SECONDS, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_REJECTED
+
+T = TypeVar("T")
+
+class PasswordHasherBusyError(Exception):
+    """Raised when a hashing request cannot get a worker in time."""
+
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(f"Password hashing unavailable: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class PasswordHasher:
+    """
+    bcrypt hashing and verification on a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL while hashing, so threads run hashes in parallel
+    and the event loop keeps serving other requests. At most `workers` hashes
+    run at once; up to `max_queue` more wait for a worker for at most
+    `queue_timeout` seconds. Anything beyond that fails fast with
+    PasswordHasherBusyError instead of piling up behind a slow queue.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 4, max_queue: int = 64,
+                 queue_timeout: float = 2.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self._waiting = 0
+
+    async def _run(self, operation: str, func: Callable[..., T], *args) -> T:
+        if self._waiting >= self.max_queue:
+            PASSWORD_HASH_REJECTED.labels(reason="queue_full").inc()
+            raise PasswordHasherBusyError("queue full")
+
+        self._waiting += 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(self._waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            PASSWORD_HASH_REJECTED.labels(reason="timeout").inc()
+            raise PasswordHasherBusyError("queue timeout")
+        finally:
+            self._waiting -= 1
+            PASSWORD_HASH_QUEUE_DEPTH.set(self._waiting)
+
+        try:
+            started = time.perf_counter()
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            PASSWORD_HASH_SECONDS.labels(operation=operation).observe(time.perf_counter() - started)
+            return result
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run("verify", self.context.verify, password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2")),
+)
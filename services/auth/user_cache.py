@@ -0,0 +1,120 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from instrumentation import USER_CACHE_REQUESTS, USER_CACHE_INVALIDATIONS
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Immutable copy of the user fields needed for authorization and UserResponse."""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+    created_at: datetime
+    updated_at: datetime
+    last_login: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+            last_login=user.last_login,
+        )
+
+class UserCache:
+    """
+    Bounded LRU of user snapshots keyed by username, with a per-entry TTL.
+
+    Entries are also reachable by user id. Code that changes a user
+    (deactivation, profile update, login) must call invalidate(); the TTL
+    bounds staleness for changes made by other workers or replicas.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, UserSnapshot]]" = OrderedDict()
+        self._usernames_by_id: Dict[int, str] = {}
+
+    def get(self, username: str) -> Optional[UserSnapshot]:
+        """Return a fresh snapshot for username, or None on a miss."""
+        entry = self._entries.get(username)
+        if entry is None or entry[0] <= self._clock():
+            if entry is not None:
+                self._remove(username)
+            USER_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+
+        self._entries.move_to_end(username)
+        USER_CACHE_REQUESTS.labels(result="hit").inc()
+        return entry[1]
+
+    def get_by_id(self, user_id: int) -> Optional[UserSnapshot]:
+        username = self._usernames_by_id.get(user_id)
+        if username is None:
+            USER_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+        return self.get(username)
+
+    def put(self, snapshot: UserSnapshot):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        # A renamed user must not stay reachable under the old name
+        previous = self._usernames_by_id.get(snapshot.id)
+        if previous is not None and previous != snapshot.username:
+            self._remove(previous)
+
+        self._entries[snapshot.username] = (self._clock() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot.username)
+        self._usernames_by_id[snapshot.id] = snapshot.username
+        while len(self._entries) > self.max_entries:
+            oldest, _ = next(iter(self._entries.items()))
+            self._remove(oldest)
+
+    def update(self, username: str, **changes) -> bool:
+        """Apply field changes to a cached snapshot, keeping its expiry; returns True if one was cached."""
+        entry = self._entries.get(username)
+        if entry is None:
+            return False
+        self._entries[username] = (entry[0], replace(entry[1], **changes))
+        return True
+
+    def invalidate(self, user_id: Optional[int] = None, username: Optional[str] = None) -> bool:
+        """Drop the cached snapshot of a user; returns True if one was cached."""
+        if username is None and user_id is not None:
+            username = self._usernames_by_id.get(user_id)
+        if username is None or username not in self._entries:
+            return False
+        self._remove(username)
+        USER_CACHE_INVALIDATIONS.inc()
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._usernames_by_id.clear()
+
+    def _remove(self, username: str):
+        _, snapshot = self._entries.pop(username)
+        if self._usernames_by_id.get(snapshot.id) == username:
+            del self._usernames_by_id[snapshot.id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+user_cache = UserCache(
+    max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "30")),
+)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from typing import Any, List, Optional, Tuple
+
+from aiokafka import AIOKafkaProducer
+
+from kafka_client import BaseEventProducer, KafkaRecord, BACKEND_AIOKAFKA, SEND_MODE_BUFFERED, COMPRESSION_NONE
+from schemas import EnrichedEvent
+from instrumentation import KAFKA_ENQUEUE_LATENCY, KAFKA_ACK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class AIOKafkaEventProducer(BaseEventProducer):
+    """
+    Нативный asyncio producer: записи копятся в аккумуляторе aiokafka
+    и отправляются пачками прямо из event loop, без пула потоков.
+    """
+    backend = BACKEND_AIOKAFKA
+
+    async def initialize(self):
+        """Инициализация Kafka Producer"""
+        producer = self._create_producer()
+        try:
+            await producer.start()
+        except Exception as e:
+            logger.error(f"Failed to initialize Kafka producer: {e}")
+            await producer.stop()
+            return False
+
+        self.producer = producer
+        logger.info(
+            f"Kafka producer initialized for servers: {self.bootstrap_servers} "
+            f"(backend: {self.backend}, send mode: {self.send_mode}, max in flight: {self.max_in_flight}, "
+            f"compression: {self.compression_type or COMPRESSION_NONE}, batch size: {self.batch_size}, "
+            f"linger: {self.linger_ms}ms, partition key: {self.partition_strategy})"
+        )
+        return True
+
+    def _create_producer(self) -> AIOKafkaProducer:
+        """Создание asyncio producer"""
+        return AIOKafkaProducer(
+            bootstrap_servers=self.bootstrap_servers,
+            acks='all',  # Ждать подтверждения от всех реплик
+            partitioner=self.partitioner,
+            max_batch_size=self.batch_size,
+            linger_ms=self.linger_ms,  # Ожидание для наполнения батча
+            request_timeout_ms=int(self.ack_timeout * 1000),
+            compression_type=self.compression_type
+        )
+
+    def _on_delivery(self, future: asyncio.Future, event_id: str, buffered_at: float):
+        """Callback доставки записи в буферизованном режиме"""
+        if future.cancelled() or future.exception() is not None:
+            self._record_delivery(failed=1)
+            error = "cancelled" if future.cancelled() else future.exception()
+            logger.error(f"Failed to deliver event {event_id} to Kafka: {error}")
+        else:
+            KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
+            self._record_delivery(sent=1)
+
+    async def _enqueue(self, record: KafkaRecord) -> asyncio.Future:
+        """Постановка записи в аккумулятор; ожидание только при заполненном буфере"""
+        started = time.perf_counter()
+        delivery = await self.producer.send(
+            self.topic,
+            key=record.key,
+            value=record.value,
+            headers=record.headers
+        )
+        KAFKA_ENQUEUE_LATENCY.observe(time.perf_counter() - started)
+        return delivery
+
+    async def send_event(self, event: EnrichedEvent) -> str:
+        """Отправка события в Kafka"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        event_id = event.event_id
+
+        self._reserve(1)
+        try:
+            delivery = await self._enqueue(self.to_record(event))
+            buffered_at = time.perf_counter()
+            if self.send_mode == SEND_MODE_BUFFERED:
+                delivery.add_done_callback(lambda f: self._on_delivery(f, event_id, buffered_at))
+                logger.debug(f"Event {event_id} buffered for Kafka topic '{self.topic}'")
+                return event_id
+
+            await asyncio.wait_for(delivery, timeout=self.ack_timeout)
+            KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
+            self._record_delivery(sent=1)
+            logger.debug(f"Event {event_id} sent to Kafka topic '{self.topic}'")
+            return event_id
+
+        except Exception as e:
+            self._record_delivery(failed=1)
+            logger.error(f"Failed to send event {event_id} to Kafka: {e}")
+            raise
+
+    async def send_events(self, events: List[EnrichedEvent]) -> List[Optional[str]]:
+        """
+        Отправка пачки событий: все записи ставятся в аккумулятор подряд,
+        затем (в режиме ack) подтверждения ожидаются одновременно.
+        """
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        # Сериализация до резервирования: ее ошибка не должна занимать места
+        records = [self.to_record(event) for event in events]
+        self._reserve(len(events))
+        deliveries, buffered_at = await self._enqueue_all(records)
+
+        results: List[Optional[str]] = []
+        if self.send_mode == SEND_MODE_BUFFERED:
+            for event, delivery in zip(events, deliveries):
+                event_id = event.event_id
+                if isinstance(delivery, Exception):
+                    logger.error(f"Failed to send event {event_id} to Kafka: {delivery}")
+                    results.append(None)
+                    continue
+                delivery.add_done_callback(
+                    lambda f, event_id=event_id: self._on_delivery(f, event_id, buffered_at)
+                )
+                results.append(event_id)
+            return results
+
+        errors = await self._await_deliveries(deliveries, buffered_at)
+        for event, error in zip(events, errors):
+            if error is None:
+                results.append(event.event_id)
+            else:
+                logger.error(f"Failed to send event {event.event_id} to Kafka: {error}")
+                results.append(None)
+
+        logger.debug(f"Batch of {len(events)} events sent to Kafka topic '{self.topic}'")
+        return results
+
+    async def send_records(self, records: List[KafkaRecord]) -> List[Optional[Exception]]:
+        """Отправка готовых записей с ожиданием подтверждений (повтор из spool)"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(len(records))
+        deliveries, buffered_at = await self._enqueue_all(records)
+        return await self._await_deliveries(deliveries, buffered_at)
+
+    async def _enqueue_all(self, records: List[KafkaRecord]) -> Tuple[List[Any], float]:
+        """Постановка пачки записей в аккумулятор подряд (ошибка постановки - вместо future)"""
+        deliveries: List[Any] = []
+        for record in records:
+            try:
+                deliveries.append(await self._enqueue(record))
+            except Exception as e:
+                self._record_delivery(failed=1)
+                deliveries.append(e)
+        return deliveries, time.perf_counter()
+
+    async def _await_deliveries(self, deliveries: List[Any], buffered_at: float) -> List[Optional[Exception]]:
+        """Одновременное ожидание подтверждений пачки; ошибка или None для каждой записи"""
+        pending = [delivery for delivery in deliveries if not isinstance(delivery, Exception)]
+        if pending:
+            await asyncio.wait(pending, timeout=self.ack_timeout)
+            KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
+
+        errors: List[Optional[Exception]] = []
+        sent = failed = 0
+        for delivery in deliveries:
+            if isinstance(delivery, Exception):
+                errors.append(delivery)
+            elif not delivery.done():
+                delivery.cancel()
+                failed += 1
+                errors.append(asyncio.TimeoutError("Delivery timed out"))
+            elif delivery.cancelled() or delivery.exception() is not None:
+                failed += 1
+                errors.append(delivery.exception() if not delivery.cancelled() else asyncio.CancelledError())
+            else:
+                sent += 1
+                errors.append(None)
+
+        self._record_delivery(sent=sent, failed=failed)
+        return errors
+
+    async def health_check(self) -> bool:
+        """Проверка подключения к Kafka"""
+        if not self.producer:
+            return False
+
+        try:
+            partitions = await self.producer.partitions_for(self.topic)
+            return partitions is not None
+        except Exception as e:
+            logger.error(f"Kafka health check failed: {e}")
+            return False
+
+    async def close(self):
+        """Закрытие producer (буферизованные записи дописываются перед закрытием)"""
+        if self.producer:
+            logger.info(f"Flushing Kafka producer ({self._in_flight} records in flight)")
+            try:
+                await asyncio.wait_for(self.producer.stop(), timeout=self.close_timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Kafka producer flush timed out after {self.close_timeout}s")
+            logger.info("Kafka producer closed")
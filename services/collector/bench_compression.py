@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кодеков значения и сжатия батчей producer'а без брокера.
+
+События из типового корпуса кодируются выбранным кодеком (KAFKA_VALUE_CODEC)
+и складываются в батчи Kafka тем же построителем, что использует kafka-python,
+с заданными compression_type и batch_size. Для каждой комбинации выводятся
+события/с, CPU на событие и байты на проводе (размер сжатых батчей).
+
+Примеры:
+    python bench_compression.py
+    python bench_compression.py --codec orjson msgpack --compression lz4 zstd --batch-size 65536 262144
+    python bench_compression.py --events 50000 --json > compression.json
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from kafka import KafkaProducer
+from kafka.record.memory_records import MemoryRecordsBuilder
+
+from kafka_client import COMPRESSION_NONE, COMPRESSION_CHECKS
+from schemas import EventPayload, EnrichedEvent
+from serializers import CODECS, get_codec, CODEC_HEADER
+
+EVENT_TYPES = ["page_view", "button_click", "feature_usage", "form_submit", "message_sent", "error"]
+URLS = ["/", "/dashboard", "/admin", "/login", "/settings", "/reports/weekly"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_1) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+]
+RESOLUTIONS = ["1920x1080", "2560x1440", "1366x768", "390x844"]
+
+def build_corpus(size: int, seed: int = 42) -> List[EnrichedEvent]:
+    """Корпус событий, похожий на трафик фронтенда (analytics.js)"""
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    corpus = []
+    for i in range(size):
+        event_type = rng.choice(EVENT_TYPES)
+        additional_data = {"section": rng.choice(["stats", "messages", "features", "navbar"])}
+        if event_type == "button_click":
+            additional_data["button_name"] = rng.choice(["refresh", "save", "export", "like"])
+        elif event_type == "message_sent":
+            additional_data["message_length"] = rng.randint(1, 500)
+        elif event_type == "error":
+            additional_data["error_message"] = "TypeError: Cannot read properties of undefined"
+
+        timestamp = (started + timedelta(milliseconds=i * 37)).isoformat()
+        payload = EventPayload(
+            event_type=event_type,
+            user_id=f"user_{rng.randint(1, 2000):06d}",
+            session_id=f"session_{rng.randint(1, 10 ** 12)}_{rng.getrandbits(32):x}",
+            timestamp=timestamp,
+            url=rng.choice(URLS),
+            user_agent=rng.choice(USER_AGENTS),
+            screen_resolution=rng.choice(RESOLUTIONS),
+            additional_data=additional_data
+        )
+        corpus.append(EnrichedEvent.from_payload(
+            payload,
+            client_ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            received_at=timestamp
+        ))
+    return corpus
+
+def run_case(corpus: List[EnrichedEvent], codec_name: str, compression: str, batch_size: int) -> dict:
+    """Кодирование корпуса и сборка сжатых батчей для одной комбинации настроек"""
+    codec = get_codec(codec_name)
+    compression_id = KafkaProducer._COMPRESSORS[None if compression == COMPRESSION_NONE else compression][1]
+    headers = codec.headers
+    timestamp_ms = int(time.time() * 1000)
+
+    raw_bytes = wire_bytes = batches = 0
+    builder = MemoryRecordsBuilder(magic=2, compression_type=compression_id, batch_size=batch_size)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for event in corpus:
+        key = event.event_id.encode("utf-8")
+        value = codec.encode(event)
+        raw_bytes += len(value)
+        if builder.append(timestamp_ms, key, value, headers) is None:
+            builder.close()
+            wire_bytes += builder.size_in_bytes()
+            batches += 1
+            builder = MemoryRecordsBuilder(magic=2, compression_type=compression_id, batch_size=batch_size)
+            builder.append(timestamp_ms, key, value, headers)
+    builder.close()
+    wire_bytes += builder.size_in_bytes()
+    batches += 1
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    events = len(corpus)
+    return {
+        "codec": codec.name,
+        "compression": compression,
+        "batch_size": batch_size,
+        "events": events,
+        "batches": batches,
+        "events_per_second": round(events / elapsed, 1),
+        "cpu_us_per_event": round(cpu / events * 1_000_000, 2),
+        "value_bytes_per_event": round(raw_bytes / events, 1),
+        "wire_bytes_per_event": round(wire_bytes / events, 1),
+        "compression_ratio": round(raw_bytes / wire_bytes, 2)
+    }
+
+def main():
+    available = [COMPRESSION_NONE] + [name for name, check in COMPRESSION_CHECKS.items() if check()]
+
+    parser = argparse.ArgumentParser(description="Value codec / compression / batch size benchmark")
+    parser.add_argument("--codec", nargs="+", choices=list(CODECS), default=list(CODECS))
+    parser.add_argument("--compression", nargs="+", choices=available, default=available)
+    parser.add_argument("--batch-size", nargs="+", type=int, default=[16384, 65536, 262144])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.events)
+    results = [
+        run_case(corpus, codec_name, compression, batch_size)
+        for codec_name in args.codec
+        for compression in args.compression
+        for batch_size in args.batch_size
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"🚀 {args.events} events, header '{CODEC_HEADER}', available compression: {', '.join(available)}")
+    columns = [
+        "codec", "compression", "batch_size", "events_per_second",
+        "cpu_us_per_event", "wire_bytes_per_event", "compression_ratio"
+    ]
+    print(" | ".join(f"{column:>20}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{str(result[column]):>20}" for column in columns))
+
+if __name__ == "__main__":
+    main()
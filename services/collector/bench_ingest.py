@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест пути приема событий: клиент -> (gateway ->) collector -> Kafka.
+
+Поднимает collector с producer'ом в памяти процесса (KAFKA_PRODUCER_BACKEND=memory)
+и, для цели gateway, API gateway перед ним - внешние сервисы не нужны.
+Нагрузка - смесь событий, похожая на поток фронтенда (типы событий с весами,
+частые и редкие пользователи, additional_data разного размера).
+
+Режимы нагрузки:
+    закрытый цикл  --concurrency N       N клиентов шлют запрос сразу после ответа
+    открытый цикл  --rate R              R запросов в секунду (равномерно или --poisson)
+                                         независимо от ответов; задержка считается от
+                                         запланированного времени отправки
+
+Результат - JSON: пропускная способность, p50/p95/p99/max задержки (мс), ошибки.
+С --baseline результат сравнивается с сохраненным прогоном; при ухудшении больше
+--max-regression код возврата 1 (для проверки регрессий в CI).
+
+Примеры:
+    python bench_ingest.py --target collector --mode single --concurrency 32 --requests 5000
+    python bench_ingest.py --target gateway --mode batch --batch-size 100 --rate 200 --duration 20
+    python bench_ingest.py --target gateway --output baseline.json
+    python bench_ingest.py --target gateway --baseline baseline.json --max-regression 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+COLLECTOR_DIR = os.path.dirname(os.path.abspath(__file__))
+GATEWAY_DIR = os.path.join(os.path.dirname(COLLECTOR_DIR), "api-gateway")
+
+# Доли типов событий и данные, которые фронтенд передает с каждым типом
+EVENT_MIX = [
+    ("page_view", 0.5, lambda rng: {"referrer": rng.choice(["/", "/login", "/reports", ""])}),
+    ("button_click", 0.3, lambda rng: {"button_name": rng.choice(["refresh", "export", "filter", "save"])}),
+    ("feature_usage", 0.15, lambda rng: {
+        "feature": rng.choice(["timeseries", "by_user", "by_type"]),
+        "filters": {f"field_{i}": rng.randint(0, 100) for i in range(rng.randint(1, 8))}
+    }),
+    ("error", 0.05, lambda rng: {"message": "TypeError: x is undefined", "stack": "at main.js:1:1\n" * rng.randint(5, 30)}),
+]
+URLS = ["/dashboard", "/reports", "/reports/weekly", "/settings", "/users"]
+SCREENS = ["1920x1080", "1366x768", "2560x1440", "390x844"]
+
+# Метрики, сравниваемые с baseline: имя -> True, если больше - лучше
+COMPARED_METRICS = {
+    "requests_per_second": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+}
+
+class EventFactory:
+    """Генератор событий EventPayload с воспроизводимой (seed) смесью"""
+
+    def __init__(self, seed: int = 42, users: int = 10000):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.types = [event_type for event_type, _, _ in EVENT_MIX]
+        self.weights = [weight for _, weight, _ in EVENT_MIX]
+        self.extras = {event_type: extra for event_type, _, extra in EVENT_MIX}
+
+    def event(self) -> dict:
+        rng = self.rng
+        event_type = rng.choices(self.types, self.weights)[0]
+        # Небольшая часть пользователей дает большую часть событий
+        user = int(self.users * rng.random() ** 3)
+        return {
+            "event_type": event_type,
+            "user_id": f"user_{user:05d}",
+            "session_id": f"session_{user:05d}_{rng.randint(0, 3)}",
+            "timestamp": datetime.utcnow().isoformat(),
+            "url": rng.choice(URLS),
+            "user_agent": "Mozilla/5.0 (X11; Linux x86_64) BenchAgent/1.0",
+            "screen_resolution": rng.choice(SCREENS),
+            "additional_data": self.extras[event_type](rng),
+        }
+
+    def body(self, batch_size: int) -> bytes:
+        if batch_size == 1:
+            return json.dumps(self.event()).encode()
+        return json.dumps([self.event() for _ in range(batch_size)]).encode()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(directory: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    """uvicorn main:app сервиса из directory в отдельном процессе"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--no-access-log", "--log-level", "warning"],
+        cwd=directory,
+        env={**os.environ, "LOG_LEVEL": "WARNING", **env}
+    )
+
+async def wait_ready(url: str, timeout: float = 20.0):
+    """Ожидание запуска сервера"""
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class LoadResult:
+    """Задержки и ошибки одного прогона"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def record(self, started: float, status: Optional[int] = None, error: Optional[str] = None):
+        self.latencies.append((time.perf_counter() - started) * 1000)
+        if error is not None:
+            self.errors[error] += 1
+        else:
+            self.statuses[status] += 1
+            if status >= 400:
+                self.errors[f"http_{status}"] += 1
+
+    def report(self, elapsed: float, batch_size: int) -> dict:
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        return {
+            "requests": requests,
+            "events": requests * batch_size,
+            "errors": sum(self.errors.values()),
+            "error_breakdown": dict(self.errors),
+            "status_codes": {str(code): count for code, count in sorted(self.statuses.items())},
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(requests / elapsed, 1) if elapsed else 0.0,
+            "events_per_second": round(requests * batch_size / elapsed, 1) if elapsed else 0.0,
+            "latency_p50_ms": round(percentile(latencies, 0.50), 3),
+            "latency_p95_ms": round(percentile(latencies, 0.95), 3),
+            "latency_p99_ms": round(percentile(latencies, 0.99), 3),
+            "latency_max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        }
+
+async def send(client: httpx.AsyncClient, path: str, body: bytes, result: LoadResult, started: float):
+    try:
+        response = await client.post(path, content=body, headers={"Content-Type": "application/json"})
+        result.record(started, status=response.status_code)
+    except httpx.HTTPError as e:
+        result.record(started, error=type(e).__name__)
+
+async def closed_loop(client: httpx.AsyncClient, path: str, bodies: List[bytes],
+                      concurrency: int, result: LoadResult, deadline: Optional[float]):
+    """concurrency клиентов, каждый отправляет следующий запрос после ответа на предыдущий"""
+    remaining = iter(bodies)
+
+    async def worker():
+        for body in remaining:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            await send(client, path, body, result, time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+async def open_loop(client: httpx.AsyncClient, path: str, bodies: List[bytes], rate: float,
+                    poisson: bool, max_outstanding: int, result: LoadResult,
+                    deadline: Optional[float], rng: random.Random):
+    """
+    Запросы по расписанию rate в секунду, не дожидаясь ответов. Задержка
+    считается от запланированного момента (без coordinated omission); если
+    ответов ждут уже max_outstanding запросов, новые считаются ошибкой.
+    """
+    tasks = set()
+    next_at = time.perf_counter()
+    for body in bodies:
+        if deadline is not None and next_at >= deadline:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_outstanding:
+            result.record(next_at, error="client_overloaded")
+        else:
+            task = asyncio.create_task(send(client, path, body, result, next_at))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        next_at += rng.expovariate(rate) if poisson else 1 / rate
+    if tasks:
+        await asyncio.gather(*tasks)
+
+async def run(args) -> dict:
+    collector_port = free_port()
+    collector_url = f"http://127.0.0.1:{collector_port}"
+    spool_dir = tempfile.mkdtemp(prefix="bench-spool-")
+    servers = [start_server(COLLECTOR_DIR, collector_port, {
+        "KAFKA_PRODUCER_BACKEND": "memory",
+        "COLLECTOR_SPOOL_DIR": spool_dir,
+    })]
+    target_url = collector_url
+    if args.target == "gateway":
+        gateway_port = free_port()
+        target_url = f"http://127.0.0.1:{gateway_port}"
+        servers.append(start_server(GATEWAY_DIR, gateway_port, {
+            "COLLECTOR_SERVICE_URL": collector_url,
+            "RATE_LIMIT_EVENTS": "100000000/minute",
+            "ACCESS_LOG_EVENTS_SAMPLE_RATE": "0",
+        }))
+
+    try:
+        await wait_ready(f"{collector_url}/health")
+        if args.target == "gateway":
+            await wait_ready(f"{target_url}/healthz")
+
+        factory = EventFactory(seed=args.seed)
+        batch_size = args.batch_size if args.mode == "batch" else 1
+        path = "/events/batch" if args.mode == "batch" else "/events"
+        # Тела генерируются заранее, чтобы генерация не влияла на замер
+        bodies = [factory.body(batch_size) for _ in range(args.requests)]
+
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(base_url=target_url, limits=limits, timeout=args.timeout) as client:
+            # Прогрев соединений и кешей сервисов
+            warmup = LoadResult()
+            await closed_loop(client, path, bodies[:args.warmup], min(args.connections, 16), warmup, None)
+
+            result = LoadResult()
+            started = time.perf_counter()
+            deadline = started + args.duration if args.duration else None
+            if args.rate:
+                await open_loop(client, path, bodies, args.rate, args.poisson, args.max_outstanding,
+                                result, deadline, factory.rng)
+            else:
+                await closed_loop(client, path, bodies, args.concurrency, result, deadline)
+            elapsed = time.perf_counter() - started
+
+        return {
+            "target": args.target,
+            "mode": args.mode,
+            "batch_size": batch_size,
+            "load": "open" if args.rate else "closed",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate or None,
+            **result.report(elapsed, batch_size),
+        }
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def compare(result: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Метрики, ухудшившиеся относительно baseline больше чем на max_regression"""
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(f"{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway/collector ingest load test")
+    parser.add_argument("--target", choices=["collector", "gateway"], default="collector")
+    parser.add_argument("--mode", choices=["single", "batch"], default="single")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000, help="requests to prepare (upper bound)")
+    parser.add_argument("--duration", type=float, default=0, help="stop after N seconds (0 - send all requests)")
+    parser.add_argument("--concurrency", type=int, default=32, help="closed loop: concurrent clients")
+    parser.add_argument("--rate", type=float, default=0, help="open loop: requests per second")
+    parser.add_argument("--poisson", action="store_true", help="open loop: Poisson arrivals instead of uniform")
+    parser.add_argument("--max-outstanding", type=int, default=1000, help="open loop: max requests awaiting a response")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON result to a file")
+    parser.add_argument("--baseline", help="JSON result of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(result, json.load(baseline_file), args.max_regression)
+        if regressions:
+            print("❌ Regression against baseline:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print("✅ No regression against baseline", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк реализаций producer'а (KAFKA_PRODUCER_BACKEND).
+
+Примеры:
+    # брокер в памяти процесса, без внешних сервисов
+    python bench_producer.py --backend memory threaded aiokafka --events 20000
+
+    # локальный Redpanda из docker-compose.dev.yml
+    KAFKA_BOOTSTRAP_SERVERS=localhost:19092 python bench_producer.py --backend threaded aiokafka
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from kafka_client import create_event_producer, BACKENDS, SEND_MODES
+from partitioning import PARTITION_STRATEGIES
+from schemas import EventPayload, EnrichedEvent
+
+def make_event(i: int) -> EnrichedEvent:
+    """Типичное событие после обогащения в collect_event"""
+    payload = EventPayload(
+        event_type="button_click",
+        user_id=f"user_{i % 1000}",
+        session_id=f"session_{i % 5000}",
+        timestamp=datetime.utcnow().isoformat(),
+        url="/dashboard",
+        user_agent="Mozilla/5.0 (X11; Linux x86_64) BenchAgent/1.0",
+        screen_resolution="1920x1080",
+        additional_data={"button_name": "refresh", "section": "stats"}
+    )
+    return EnrichedEvent.from_payload(payload, client_ip="127.0.0.1", received_at=datetime.utcnow().isoformat())
+
+async def run_backend(backend: str, events: int, concurrency: int, batch_size: int) -> dict:
+    """Прогон одной реализации: concurrency воркеров отправляют events событий"""
+    producer = create_event_producer(backend)
+    if producer.backend != backend:
+        return {"backend": backend, "error": f"unavailable, got '{producer.backend}'"}
+    if not await producer.initialize():
+        return {"backend": backend, "error": "failed to initialize"}
+
+    payloads = [make_event(i) for i in range(events)]
+    queue = asyncio.Queue()
+    for start in range(0, events, batch_size):
+        queue.put_nowait(payloads[start:start + batch_size])
+
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            chunk = queue.get_nowait()
+            try:
+                if batch_size == 1:
+                    await producer.send_event(chunk[0])
+                else:
+                    results = await producer.send_events(chunk)
+                    errors += sum(1 for event_id in results if event_id is None)
+            except Exception:
+                errors += len(chunk)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await producer.close()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    return {
+        "backend": backend,
+        "send_mode": producer.send_mode,
+        "codec": producer.codec.name,
+        "partition_key": producer.partition_strategy,
+        "events": events,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1),
+        "cpu_us_per_event": round(cpu / events * 1_000_000, 1)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Producer backend throughput benchmark")
+    parser.add_argument("--backend", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--send-mode", choices=SEND_MODES, default=None)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--codec", default=None, help="json | orjson | msgpack")
+    parser.add_argument("--partition-key", choices=PARTITION_STRATEGIES, default=None)
+    parser.add_argument("--sticky", action="store_true", help="sticky partition for keyless records")
+    args = parser.parse_args()
+
+    if args.send_mode:
+        os.environ["KAFKA_SEND_MODE"] = args.send_mode
+    if args.codec:
+        os.environ["KAFKA_VALUE_CODEC"] = args.codec
+    if args.partition_key:
+        os.environ["KAFKA_PARTITION_KEY"] = args.partition_key
+    if args.sticky:
+        os.environ["KAFKA_STICKY_PARTITIONER"] = "true"
+    os.environ.setdefault("KAFKA_MAX_IN_FLIGHT", str(args.events))
+
+    print(
+        f"🚀 {args.events} events, concurrency {args.concurrency}, batch size {args.batch_size}, "
+        f"codec {os.getenv('KAFKA_VALUE_CODEC', 'json')}"
+    )
+    for backend in args.backend:
+        result = await run_backend(backend, args.events, args.concurrency, args.batch_size)
+        print(result)
+
+if __name__ == "__main__":
+    asyncio.run(main())
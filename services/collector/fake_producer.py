@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from kafka_client import BaseEventProducer, KafkaRecord, BACKEND_MEMORY, SEND_MODE_BUFFERED
+from schemas import EnrichedEvent
+from instrumentation import KAFKA_ENQUEUE_LATENCY, KAFKA_ACK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class InMemoryEventProducer(BaseEventProducer):
+    """
+    Брокер в памяти процесса: записи сериализуются так же, как для Kafka,
+    и складываются в ограниченную очередь. Подтверждение приходит через
+    FAKE_KAFKA_ACK_LATENCY_MS, что позволяет сравнивать реализации producer'а
+    и нагружать сервис без внешнего брокера.
+    """
+    backend = BACKEND_MEMORY
+
+    def __init__(self):
+        super().__init__()
+        self.bootstrap_servers = "memory"
+        self.ack_latency = float(os.getenv("FAKE_KAFKA_ACK_LATENCY_MS", "0")) / 1000
+        self.records = deque(maxlen=int(os.getenv("FAKE_KAFKA_MAX_RECORDS", "10000")))
+        self.bytes_written = 0
+        # Партиции считаются тем же partitioner'ом, что и для Kafka
+        self.partitions = list(range(int(os.getenv("FAKE_KAFKA_PARTITIONS", "6"))))
+        self.partition_counts = [0] * len(self.partitions)
+
+    async def initialize(self):
+        """Инициализация брокера в памяти"""
+        self.producer = self
+        logger.info(
+            f"In-memory producer initialized (send mode: {self.send_mode}, "
+            f"ack latency: {self.ack_latency * 1000:.1f}ms)"
+        )
+        return True
+
+    def _append(self, record: KafkaRecord):
+        """Запись в очередь брокера"""
+        started = time.perf_counter()
+        self.records.append(tuple(record))
+        self.partition_counts[self.partitioner(record.key, self.partitions, self.partitions)] += 1
+        self.bytes_written += len(record.value)
+        KAFKA_ENQUEUE_LATENCY.observe(time.perf_counter() - started)
+
+    async def _deliver(self, count: int, wait_ack: bool = False):
+        """Доставка записей с имитацией задержки подтверждения"""
+        if self.send_mode == SEND_MODE_BUFFERED and not wait_ack:
+            if self.ack_latency > 0:
+                asyncio.get_event_loop().call_later(self.ack_latency, self._record_delivery, count)
+            else:
+                self._record_delivery(sent=count)
+            return
+
+        if self.ack_latency > 0:
+            await asyncio.sleep(self.ack_latency)
+        KAFKA_ACK_LATENCY.observe(self.ack_latency)
+        self._record_delivery(sent=count)
+
+    async def send_event(self, event: EnrichedEvent) -> str:
+        """Отправка события в брокер в памяти"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(1)
+        self._append(self.to_record(event))
+        await self._deliver(1)
+        return event.event_id
+
+    async def send_events(self, events: List[EnrichedEvent]) -> List[Optional[str]]:
+        """Отправка пачки событий в брокер в памяти"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(len(events))
+        for event in events:
+            self._append(self.to_record(event))
+        await self._deliver(len(events))
+        return [event.event_id for event in events]
+
+    async def send_records(self, records: List[KafkaRecord]) -> List[Optional[Exception]]:
+        """Отправка готовых записей в брокер в памяти (повтор из spool)"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(len(records))
+        for record in records:
+            self._append(record)
+        await self._deliver(len(records), wait_ack=True)
+        return [None] * len(records)
+
+    async def health_check(self) -> bool:
+        """Брокер в памяти доступен всегда после инициализации"""
+        return self.producer is not None
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Получение метрик producer"""
+        return {
+            **await super().get_metrics(),
+            "bytes_written": self.bytes_written,
+            "partition_counts": self.partition_counts
+        }
+
+    async def close(self):
+        """Закрытие брокера в памяти"""
+        self.producer = None
+        logger.info("In-memory producer closed")
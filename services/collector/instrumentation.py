@@ -0,0 +1,104 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Если задан PROMETHEUS_MULTIPROC_DIR (до импорта prometheus_client), значения
+# метрик каждого воркера uvicorn пишутся в mmap-файлы этого каталога,
+# а /metrics агрегирует их через MultiProcessCollector.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+EVENTS_RECEIVED = Counter(
+    "collector_events_received_total",
+    "Events received by the collector",
+    ["endpoint"]
+)
+EVENTS_REJECTED = Counter(
+    "collector_events_rejected_total",
+    "Events rejected by the collector",
+    ["reason"]
+)
+REQUEST_LATENCY = Histogram(
+    "collector_request_duration_seconds",
+    "Time to handle an ingest request",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+VALIDATION_LATENCY = Histogram(
+    "collector_validation_duration_seconds",
+    "Time to parse and validate a request body",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+KAFKA_ENQUEUE_LATENCY = Histogram(
+    "collector_kafka_enqueue_duration_seconds",
+    "Time to hand records to the producer buffer",
+    buckets=LATENCY_BUCKETS
+)
+KAFKA_ACK_LATENCY = Histogram(
+    "collector_kafka_ack_duration_seconds",
+    "Time from buffering a record to the broker acknowledgement",
+    buckets=LATENCY_BUCKETS
+)
+KAFKA_DELIVERIES = Counter(
+    "collector_kafka_deliveries_total",
+    "Records acknowledged or failed by the broker",
+    ["result"]
+)
+KAFKA_IN_FLIGHT = Gauge(
+    "collector_kafka_in_flight",
+    "Records handed to the producer and not yet acknowledged",
+    multiprocess_mode="livesum"
+)
+BATCH_SIZE = Histogram(
+    "collector_batch_size_events",
+    "Number of events per batch request",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+SERIALIZED_BYTES = Histogram(
+    "collector_event_serialized_bytes",
+    "Size of a serialized event value",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+)
+SPOOL_RECORDS = Gauge(
+    "collector_spool_records",
+    "Records waiting in the local spool for replay to Kafka",
+    multiprocess_mode="livesum"
+)
+SPOOL_BYTES = Gauge(
+    "collector_spool_bytes",
+    "Bytes waiting in the local spool for replay to Kafka",
+    multiprocess_mode="livesum"
+)
+SPOOL_APPENDED = Counter(
+    "collector_spool_appended_total",
+    "Events written to the local spool instead of Kafka",
+    ["reason"]
+)
+SPOOL_REPLAYED = Counter(
+    "collector_spool_replayed_total",
+    "Spooled records replayed to Kafka",
+    ["result"]
+)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Выдача метрик в формате Prometheus (с агрегацией по воркерам в multiprocess-режиме)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead():
+    """Удаление live-gauge значений остановленного воркера"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
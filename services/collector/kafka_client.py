@@ -1,96 +1,426 @@
-import json
 import logging
-from typing import Dict, Any
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from kafka import KafkaProducer
+from kafka import codec as kafka_codec
 from kafka.errors import KafkaError
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import os
-import uuid
+import time
+
+from schemas import EnrichedEvent
+from serializers import get_codec
+from partitioning import EventPartitioner, partition_key, resolve_partition_strategy
+from instrumentation import (
+    KAFKA_ENQUEUE_LATENCY, KAFKA_ACK_LATENCY, KAFKA_DELIVERIES,
+    KAFKA_IN_FLIGHT, SERIALIZED_BYTES
+)
 
 logger = logging.getLogger(__name__)
 
-class KafkaEventProducer:
+# Режимы отправки
+SEND_MODE_ACK = "ack"            # ждать подтверждения брокера перед ответом клиенту
+SEND_MODE_BUFFERED = "buffered"  # отвечать сразу после постановки записи в буфер producer'а
+SEND_MODES = (SEND_MODE_ACK, SEND_MODE_BUFFERED)
+
+# Реализации producer'а
+BACKEND_THREADED = "threaded"  # kafka-python в пуле потоков
+BACKEND_AIOKAFKA = "aiokafka"  # нативный asyncio-клиент
+BACKEND_MEMORY = "memory"      # брокер в памяти процесса (бенчмарки, локальная отладка)
+BACKENDS = (BACKEND_THREADED, BACKEND_AIOKAFKA, BACKEND_MEMORY)
+
+# Сжатие батчей: проверка наличия библиотеки кодека (lz4, zstandard, python-snappy)
+COMPRESSION_NONE = "none"
+COMPRESSION_CHECKS = {
+    "gzip": kafka_codec.has_gzip,
+    "snappy": kafka_codec.has_snappy,
+    "lz4": kafka_codec.has_lz4,
+    "zstd": kafka_codec.has_zstd,
+}
+
+def resolve_compression_type(name: str) -> Optional[str]:
+    """
+    Тип сжатия для producer'а (None - без сжатия).
+    Если библиотека кодека не установлена, используется gzip.
+    """
+    name = (name or COMPRESSION_NONE).lower()
+    if name == COMPRESSION_NONE:
+        return None
+    if name not in COMPRESSION_CHECKS:
+        raise ValueError(
+            f"Unknown KAFKA_COMPRESSION_TYPE '{name}', "
+            f"expected one of {(COMPRESSION_NONE, *COMPRESSION_CHECKS)}"
+        )
+    if not COMPRESSION_CHECKS[name]():
+        logger.warning(f"Compression '{name}' unavailable, falling back to 'gzip'")
+        return "gzip"
+    return name
+
+class ProducerQueueFullError(RuntimeError):
+    """Превышен лимит записей, ожидающих подтверждения брокера"""
+
+class KafkaRecord(NamedTuple):
+    """Закодированная запись Kafka (в таком же виде хранится в локальном spool)"""
+    key: Optional[bytes]
+    value: bytes
+    headers: List[Tuple[str, bytes]]
+
+class BaseEventProducer(ABC):
+    """
+    Общий интерфейс producer'а событий.
+    Реализации отличаются только способом доставки записей в брокер;
+    счетчики, режим отправки и ограничение записей в полете общие.
+    """
+    backend = ""
+
     def __init__(self):
         self.bootstrap_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
         self.topic = os.getenv("KAFKA_EVENTS_TOPIC", "events")
+        self.send_mode = os.getenv("KAFKA_SEND_MODE", SEND_MODE_ACK).lower()
+        if self.send_mode not in SEND_MODES:
+            raise ValueError(f"Unknown KAFKA_SEND_MODE '{self.send_mode}', expected one of {SEND_MODES}")
+        self.max_in_flight = int(os.getenv("KAFKA_MAX_IN_FLIGHT", "10000"))
+        self.ack_timeout = float(os.getenv("KAFKA_ACK_TIMEOUT_SECONDS", "10"))
+        # Время на отправку буферизованных записей при остановке воркера
+        self.close_timeout = float(os.getenv("KAFKA_CLOSE_TIMEOUT_SECONDS", "10"))
+        self.compression_type = resolve_compression_type(os.getenv("KAFKA_COMPRESSION_TYPE", "gzip"))
+        self.batch_size = int(os.getenv("KAFKA_BATCH_SIZE", "16384"))
+        self.linger_ms = int(os.getenv("KAFKA_LINGER_MS", "10"))
+        self.codec = get_codec()
+        self.headers = self.codec.headers
+        # Ключ записи определяет партицию: события одного пользователя/сессии - в одной партиции
+        self.partition_strategy = resolve_partition_strategy(os.getenv("KAFKA_PARTITION_KEY", "event_id"))
+        # Sticky-партиция для записей без ключа (KAFKA_PARTITION_KEY=random); по умолчанию
+        # партиция меняется после ~batch_size байт при типичном размере события ~512 байт
+        self.partitioner = EventPartitioner(
+            sticky=os.getenv("KAFKA_STICKY_PARTITIONER", "false").lower() == "true",
+            sticky_records=int(os.getenv("KAFKA_STICKY_PARTITION_RECORDS", str(self.batch_size // 512)))
+        )
         self.producer = None
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Счетчики обновляются и из event loop, и из I/O-потока клиента (callbacks)
+        self._lock = threading.Lock()
         self._events_sent = 0
         self._errors = 0
-        
+        self._in_flight = 0
+
+    @abstractmethod
+    async def initialize(self) -> bool:
+        """Подключение к брокеру; возвращает False при неудаче"""
+
+    @abstractmethod
+    async def send_event(self, event: EnrichedEvent) -> str:
+        """Отправка одного события; возвращает event_id"""
+
+    @abstractmethod
+    async def send_events(self, events: List[EnrichedEvent]) -> List[Optional[str]]:
+        """Отправка пачки событий; возвращает event_id или None для каждого события"""
+
+    @abstractmethod
+    async def send_records(self, records: List[KafkaRecord]) -> List[Optional[Exception]]:
+        """
+        Отправка готовых записей с ожиданием подтверждений независимо от режима
+        отправки (повтор из spool); возвращает ошибку или None для каждой записи
+        """
+
+    @abstractmethod
+    async def health_check(self) -> bool:
+        """Проверка подключения к брокеру"""
+
+    @abstractmethod
+    async def close(self):
+        """Дописывание буферизованных записей и закрытие соединения"""
+
+    def _serialize_value(self, event: EnrichedEvent) -> bytes:
+        """Сериализация значения записи выбранным кодеком (KAFKA_VALUE_CODEC)"""
+        data = self.codec.encode(event)
+        SERIALIZED_BYTES.observe(len(data))
+        return data
+
+    def _record_key(self, event: EnrichedEvent) -> Optional[str]:
+        """Ключ записи Kafka по стратегии KAFKA_PARTITION_KEY"""
+        return partition_key(event, self.partition_strategy)
+
+    def to_record(self, event: EnrichedEvent) -> KafkaRecord:
+        """Кодирование события в запись Kafka"""
+        key = self._record_key(event)
+        return KafkaRecord(
+            key.encode('utf-8') if key else None,
+            self._serialize_value(event),
+            self.headers
+        )
+
+    def _reserve(self, count: int):
+        """Резервирование мест под записи в полете (backpressure)"""
+        with self._lock:
+            if self._in_flight + count > self.max_in_flight:
+                raise ProducerQueueFullError(
+                    f"Too many events in flight ({self._in_flight}/{self.max_in_flight})"
+                )
+            self._in_flight += count
+        KAFKA_IN_FLIGHT.inc(count)
+
+    def _record_delivery(self, sent: int = 0, failed: int = 0):
+        """Учет результата доставки и освобождение мест"""
+        with self._lock:
+            self._events_sent += sent
+            self._errors += failed
+            self._in_flight -= sent + failed
+        KAFKA_IN_FLIGHT.dec(sent + failed)
+        if sent:
+            KAFKA_DELIVERIES.labels(result="success").inc(sent)
+        if failed:
+            KAFKA_DELIVERIES.labels(result="error").inc(failed)
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Получение метрик producer"""
+        return {
+            "events_sent": self._events_sent,
+            "errors": self._errors,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "send_mode": self.send_mode,
+            "backend": self.backend,
+            "codec": self.codec.name,
+            "compression_type": self.compression_type or COMPRESSION_NONE,
+            "batch_size": self.batch_size,
+            "linger_ms": self.linger_ms,
+            "partition_key": self.partition_strategy,
+            "sticky_partitioner": self.partitioner.sticky,
+            "topic": self.topic,
+            "bootstrap_servers": self.bootstrap_servers
+        }
+
+class KafkaEventProducer(BaseEventProducer):
+    """Синхронный kafka-python, вызовы которого выполняются в пуле потоков"""
+    backend = BACKEND_THREADED
+
+    def __init__(self):
+        super().__init__()
+        self.max_block_ms = int(os.getenv("KAFKA_MAX_BLOCK_MS", "5000"))
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
     async def initialize(self):
         """Инициализация Kafka Producer"""
         try:
             loop = asyncio.get_event_loop()
             self.producer = await loop.run_in_executor(
-                self.executor, 
+                self.executor,
                 self._create_producer
             )
-            logger.info(f"Kafka producer initialized for servers: {self.bootstrap_servers}")
+            logger.info(
+                f"Kafka producer initialized for servers: {self.bootstrap_servers} "
+                f"(backend: {self.backend}, send mode: {self.send_mode}, max in flight: {self.max_in_flight}, "
+                f"compression: {self.compression_type or COMPRESSION_NONE}, batch size: {self.batch_size}, "
+                f"linger: {self.linger_ms}ms, partition key: {self.partition_strategy})"
+            )
             return True
         except Exception as e:
             logger.error(f"Failed to initialize Kafka producer: {e}")
             return False
-    
+
     def _create_producer(self) -> KafkaProducer:
         """Создание синхронного producer в отдельном потоке"""
         return KafkaProducer(
             bootstrap_servers=self.bootstrap_servers,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-            key_serializer=lambda v: v.encode('utf-8') if v else None,
             acks='all',  # Ждать подтверждения от всех реплик
             retries=3,
-            batch_size=16384,
-            linger_ms=10,  # Ждать 10ms для батчинга
-            compression_type='gzip'
+            partitioner=self.partitioner,
+            batch_size=self.batch_size,
+            linger_ms=self.linger_ms,  # Ожидание для наполнения батча
+            max_block_ms=self.max_block_ms,  # Не блокировать поток бесконечно при заполненном буфере
+            compression_type=self.compression_type
         )
-    
-    async def send_event(self, event_data: Dict[str, Any]) -> str:
+
+    def _on_send_success(self, buffered_at: float, record_metadata):
+        """Callback успешной доставки (вызывается из I/O-потока kafka-python)"""
+        KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
+        self._record_delivery(sent=1)
+
+    def _on_send_error(self, event_id: str, exc):
+        """Callback ошибки доставки (вызывается из I/O-потока kafka-python)"""
+        self._record_delivery(failed=1)
+        logger.error(f"Failed to deliver event {event_id} to Kafka: {exc}")
+
+    async def send_event(self, event: EnrichedEvent) -> str:
         """Отправка события в Kafka"""
         if not self.producer:
             raise RuntimeError("Kafka producer not initialized")
-        
-        event_id = str(uuid.uuid4())
-        event_with_id = {
-            "event_id": event_id,
-            **event_data
-        }
-        
+
+        event_id = event.event_id
+
+        self._reserve(1)
         try:
             loop = asyncio.get_event_loop()
-            future = await loop.run_in_executor(
+            if self.send_mode == SEND_MODE_BUFFERED:
+                await loop.run_in_executor(
+                    self.executor,
+                    self._send_buffered_sync,
+                    event
+                )
+                logger.debug(f"Event {event_id} buffered for Kafka topic '{self.topic}'")
+                return event_id
+
+            await loop.run_in_executor(
                 self.executor,
                 self._send_sync,
-                event_with_id,
-                event_id
+                event
             )
-            
-            self._events_sent += 1
+
+            self._record_delivery(sent=1)
             logger.debug(f"Event {event_id} sent to Kafka topic '{self.topic}'")
             return event_id
-            
+
         except Exception as e:
-            self._errors += 1
+            self._record_delivery(failed=1)
             logger.error(f"Failed to send event {event_id} to Kafka: {e}")
             raise
-    
-    def _send_sync(self, event_data: Dict[str, Any], event_id: str):
+
+    async def send_events(self, events: List[EnrichedEvent]) -> List[Optional[str]]:
+        """
+        Отправка пачки событий в Kafka одной передачей в поток.
+        Возвращает event_id для каждого события или None, если оно не отправлено.
+        """
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(len(events))
+        loop = asyncio.get_event_loop()
+        try:
+            if self.send_mode == SEND_MODE_BUFFERED:
+                errors = await loop.run_in_executor(
+                    self.executor,
+                    self._send_batch_buffered_sync,
+                    events
+                )
+            else:
+                errors = await loop.run_in_executor(
+                    self.executor,
+                    self._send_batch_sync,
+                    events
+                )
+        except Exception:
+            # Исключение наружу возможно только до учета доставки
+            # (executor закрыт, ошибка сериализации) - освобождаем все места
+            self._record_delivery(failed=len(events))
+            raise
+
+        results: List[Optional[str]] = []
+        for event, error in zip(events, errors):
+            if error is None:
+                results.append(event.event_id)
+            else:
+                logger.error(f"Failed to send event {event.event_id} to Kafka: {error}")
+                results.append(None)
+
+        logger.debug(f"Batch of {len(events)} events sent to Kafka topic '{self.topic}'")
+        return results
+
+    def _send_batch_sync(self, events: List[EnrichedEvent]) -> List[Optional[Exception]]:
+        """Синхронная отправка пачки событий"""
+        return self._send_records_sync([self.to_record(event) for event in events])
+
+    def _send_records_sync(self, records: List[KafkaRecord]) -> List[Optional[Exception]]:
+        """Синхронная отправка пачки: сначала буферизуем все записи, затем ждем подтверждений"""
+        futures = []
+        started = time.perf_counter()
+        for record in records:
+            try:
+                futures.append(self.producer.send(
+                    self.topic,
+                    key=record.key,
+                    value=record.value,
+                    headers=record.headers
+                ))
+            except Exception as e:
+                futures.append(e)
+        buffered_at = time.perf_counter()
+        KAFKA_ENQUEUE_LATENCY.observe(buffered_at - started)
+
+        errors: List[Optional[Exception]] = []
+        for future in futures:
+            if isinstance(future, Exception):
+                errors.append(future)
+                continue
+            try:
+                future.get(timeout=self.ack_timeout)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
+
+        failed = sum(1 for error in errors if error is not None)
+        self._record_delivery(sent=len(errors) - failed, failed=failed)
+        return errors
+
+    async def send_records(self, records: List[KafkaRecord]) -> List[Optional[Exception]]:
+        """Отправка готовых записей с ожиданием подтверждений (повтор из spool)"""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not initialized")
+
+        self._reserve(len(records))
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(
+                self.executor,
+                self._send_records_sync,
+                records
+            )
+        except Exception:
+            self._record_delivery(failed=len(records))
+            raise
+
+    def _send_batch_buffered_sync(self, events: List[EnrichedEvent]) -> List[Optional[Exception]]:
+        """Постановка пачки в буфер producer'а без ожидания подтверждений"""
+        errors: List[Optional[Exception]] = []
+        for event in events:
+            try:
+                self._send_buffered_sync(event)
+                errors.append(None)
+            except Exception as e:
+                self._record_delivery(failed=1)
+                errors.append(e)
+        return errors
+
+    def _send_sync(self, event: EnrichedEvent):
         """Синхронная отправка в Kafka"""
+        record = self.to_record(event)
+        started = time.perf_counter()
         future = self.producer.send(
             self.topic,
-            key=event_id,
-            value=event_data
+            key=record.key,
+            value=record.value,
+            headers=record.headers
         )
+        buffered_at = time.perf_counter()
+        KAFKA_ENQUEUE_LATENCY.observe(buffered_at - started)
         # Ждем подтверждения отправки
-        record_metadata = future.get(timeout=10)
+        record_metadata = future.get(timeout=self.ack_timeout)
+        KAFKA_ACK_LATENCY.observe(time.perf_counter() - buffered_at)
         return record_metadata
-    
+
+    def _send_buffered_sync(self, event: EnrichedEvent):
+        """Постановка записи в буфер producer'а; результат доставки придет в callback"""
+        record = self.to_record(event)
+        started = time.perf_counter()
+        future = self.producer.send(
+            self.topic,
+            key=record.key,
+            value=record.value,
+            headers=record.headers
+        )
+        buffered_at = time.perf_counter()
+        KAFKA_ENQUEUE_LATENCY.observe(buffered_at - started)
+        future.add_callback(self._on_send_success, buffered_at)
+        future.add_errback(self._on_send_error, event.event_id)
+        return future
+
     async def health_check(self) -> bool:
         """Проверка подключения к Kafka"""
         if not self.producer:
             return False
-        
+
         try:
             loop = asyncio.get_event_loop()
             metadata = await loop.run_in_executor(
@@ -101,27 +431,42 @@ class KafkaEventProducer:
         except Exception as e:
             logger.error(f"Kafka health check failed: {e}")
             return False
-    
-    async def get_metrics(self) -> Dict[str, Any]:
-        """Получение метрик producer"""
-        return {
-            "events_sent": self._events_sent,
-            "errors": self._errors,
-            "topic": self.topic,
-            "bootstrap_servers": self.bootstrap_servers
-        }
-    
+
     async def close(self):
-        """Закрытие producer"""
+        """Закрытие producer (буферизованные записи дописываются перед закрытием)"""
         if self.producer:
+            logger.info(f"Flushing Kafka producer ({self._in_flight} records in flight)")
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(
                 self.executor,
-                self.producer.close
+                lambda: self.producer.close(timeout=self.close_timeout)
             )
             logger.info("Kafka producer closed")
-        
+
         self.executor.shutdown(wait=True)
 
+def create_event_producer(backend: Optional[str] = None) -> BaseEventProducer:
+    """
+    Создание producer'а выбранной реализации (KAFKA_PRODUCER_BACKEND).
+    Если aiokafka не установлена, используется kafka-python в пуле потоков.
+    """
+    backend = (backend or os.getenv("KAFKA_PRODUCER_BACKEND", BACKEND_THREADED)).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown KAFKA_PRODUCER_BACKEND '{backend}', expected one of {BACKENDS}")
+
+    if backend == BACKEND_AIOKAFKA:
+        try:
+            from aiokafka_client import AIOKafkaEventProducer
+            return AIOKafkaEventProducer()
+        except ImportError as e:
+            logger.warning(f"aiokafka backend unavailable ({e}), falling back to '{BACKEND_THREADED}'")
+            return KafkaEventProducer()
+
+    if backend == BACKEND_MEMORY:
+        from fake_producer import InMemoryEventProducer
+        return InMemoryEventProducer()
+
+    return KafkaEventProducer()
+
 # Глобальный экземпляр producer
-kafka_producer = KafkaEventProducer()
\ No newline at end of file
+kafka_producer = create_event_producer()
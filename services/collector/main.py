@@ -1,45 +1,81 @@
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from fastapi.responses import Response
+from contextlib import asynccontextmanager, suppress
+from pydantic import ValidationError
+import asyncio
+import json
 import logging
 import time
 from datetime import datetime
-from typing import Dict, Any
-import uvicorn
+from typing import Dict, Any, List, Optional
 import os
 
-from schemas import EventPayload, EventResponse, HealthResponse, MetricsResponse
-from kafka_client import kafka_producer
+from schemas import (
+    EventPayload, EnrichedEvent, EventResponse, BatchEventResponse, BatchItemResult,
+    HealthResponse, MetricsResponse
+)
+from kafka_client import kafka_producer, ProducerQueueFullError
+from rate_metrics import SlidingWindowMetrics
+from spool import DiskSpool, SpoolFullError
+from instrumentation import (
+    EVENTS_RECEIVED, EVENTS_REJECTED, REQUEST_LATENCY, VALIDATION_LATENCY,
+    BATCH_SIZE, SPOOL_APPENDED, SPOOL_REPLAYED, render_metrics, mark_process_dead
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Метрики в памяти (в продакшене лучше использовать Redis или Prometheus)
+# Метрики процесса (Prometheus-метрики - в instrumentation.py)
 metrics = {
-    "events_total": 0,
-    "events_per_minute": 0.0,
-    "errors_total": 0,
-    "last_minute_events": [],
     "start_time": time.time()
 }
 
+# Счетчики событий/ошибок, события в минуту и перцентили задержки приема
+# (при COLLECTOR_METRICS_DIR - суммарно по всем воркерам)
+rate_window = SlidingWindowMetrics.from_env()
+
+# Максимальное количество событий в одной пачке
+MAX_BATCH_SIZE = int(os.getenv("COLLECTOR_MAX_BATCH_SIZE", "500"))
+
+# Локальный spool событий на время недоступности Kafka (включается COLLECTOR_SPOOL_DIR)
+spool = DiskSpool.from_env()
+SPOOL_REPLAY_RATE = float(os.getenv("COLLECTOR_SPOOL_REPLAY_RATE", "2000"))  # записей в секунду
+SPOOL_REPLAY_BATCH = int(os.getenv("COLLECTOR_SPOOL_REPLAY_BATCH", "500"))
+SPOOL_RETRY_MIN_SECONDS = 1.0
+SPOOL_RETRY_MAX_SECONDS = float(os.getenv("COLLECTOR_SPOOL_RETRY_MAX_SECONDS", "30"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle событий приложения"""
     # Startup
     logger.info("Starting Collector Service...")
     
+    if spool:
+        spool.open()
+    
     # Инициализация Kafka producer
     success = await kafka_producer.initialize()
     if not success:
-        logger.error("Failed to initialize Kafka producer. Service may not work properly.")
+        logger.error("Failed to initialize Kafka producer, retrying in background")
+    
+    # Переподключение к Kafka и повтор записей из spool
+    replay_task = asyncio.create_task(replay_spool())
     
     yield
     
     # Shutdown
     logger.info("Shutting down Collector Service...")
+    replay_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await replay_task
     await kafka_producer.close()
+    if spool:
+        spool.close()
+    rate_window.close()
+    mark_process_dead()
 
 # Создание FastAPI приложения
 app = FastAPI(
@@ -58,64 +94,277 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def update_metrics(success: bool = True):
-    """Обновление метрик"""
-    current_time = time.time()
-    
-    if success:
-        metrics["events_total"] += 1
-        metrics["last_minute_events"].append(current_time)
-    else:
-        metrics["errors_total"] += 1
-    
-    # Очищаем события старше минуты
-    minute_ago = current_time - 60
-    metrics["last_minute_events"] = [
-        t for t in metrics["last_minute_events"] if t > minute_ago
-    ]
-    
-    # Вычисляем события в минуту
-    metrics["events_per_minute"] = len(metrics["last_minute_events"])
-
-@app.post("/events", response_model=EventResponse, status_code=202)
-async def collect_event(
-    event: EventPayload,
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+def update_metrics(success: bool = True, count: int = 1, latency: Optional[float] = None):
+    """Обновление метрик (latency - время обработки запроса в секундах)"""
+    rate_window.record(success=success, latency=latency, count=count)
+
+def spool_events(events: List[EnrichedEvent], reason: str) -> bool:
+    """Запись событий в локальный spool; False, если spool выключен или переполнен"""
+    if spool is None:
+        return False
+    try:
+        spool.append([kafka_producer.to_record(event) for event in events])
+    except SpoolFullError as e:
+        logger.error(f"Failed to spool {len(events)} events: {e}")
+        return False
+    SPOOL_APPENDED.labels(reason=reason).inc(len(events))
+    return True
+
+async def replay_spool():
+    """
+    Фоновая задача: переподключение producer'а после неудачной инициализации
+    и повтор записей из spool в Kafka не быстрее SPOOL_REPLAY_RATE записей в секунду.
+    Позиция spool сдвигается только за подтвержденный брокером префикс пачки.
+    """
+    backoff = SPOOL_RETRY_MIN_SECONDS
+    while True:
+        try:
+            if not kafka_producer.producer:
+                if not await kafka_producer.initialize():
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, SPOOL_RETRY_MAX_SECONDS)
+                    continue
+                logger.info("Kafka producer reconnected")
+            if spool is None:
+                return
+            
+            entries = spool.read(SPOOL_REPLAY_BATCH)
+            if not entries:
+                backoff = SPOOL_RETRY_MIN_SECONDS
+                await asyncio.sleep(SPOOL_RETRY_MIN_SECONDS)
+                continue
+            
+            errors = await kafka_producer.send_records([entry.record for entry in entries])
+            delivered = next((i for i, error in enumerate(errors) if error is not None), len(errors))
+            spool.commit(entries[:delivered])
+            if delivered:
+                SPOOL_REPLAYED.labels(result="success").inc(delivered)
+            if delivered < len(entries):
+                SPOOL_REPLAYED.labels(result="error").inc(len(entries) - delivered)
+                logger.warning(
+                    f"Spool replay stopped after {delivered}/{len(entries)} records: {errors[delivered]}"
+                )
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, SPOOL_RETRY_MAX_SECONDS)
+                continue
+            
+            backoff = SPOOL_RETRY_MIN_SECONDS
+            await asyncio.sleep(delivered / SPOOL_REPLAY_RATE)
+        except asyncio.CancelledError:
+            raise
+        except ProducerQueueFullError:
+            # Живой трафик важнее повтора: ждем освобождения мест
+            await asyncio.sleep(SPOOL_RETRY_MIN_SECONDS)
+        except Exception as e:
+            logger.error(f"Spool replay failed: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, SPOOL_RETRY_MAX_SECONDS)
+
+def validate_event(body: bytes) -> EventPayload:
+    """Валидация тела запроса прямо из JSON-байтов (без промежуточного dict)"""
+    started = time.perf_counter()
+    try:
+        return EventPayload.model_validate_json(body)
+    except ValidationError as e:
+        EVENTS_REJECTED.labels(reason="validation").inc()
+        # Та же форма ошибки 422, что и при валидации параметром эндпоинта
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors()]
+        )
+    finally:
+        VALIDATION_LATENCY.labels(endpoint="events").observe(time.perf_counter() - started)
+
+@app.post(
+    "/events",
+    response_model=EventResponse,
+    status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": EventPayload.model_json_schema()}}
+        }
+    }
+)
+async def collect_event(request: Request):
     """
     Принимает событие от фронтенда и отправляет в Kafka
     """
+    started = time.perf_counter()
+    EVENTS_RECEIVED.labels(endpoint="events").inc()
+    event = validate_event(await request.body())
     try:
         # Добавляем метаданные к событию
-        enriched_event = {
-            **event.dict(),
-            "client_ip": request.client.host,
-            "received_at": datetime.utcnow().isoformat(),
-            "service": "collector"
-        }
+        enriched_event = EnrichedEvent.from_payload(
+            event,
+            client_ip=request.client.host,
+            received_at=datetime.utcnow().isoformat()
+        )
         
-        # Отправляем событие в Kafka
-        event_id = await kafka_producer.send_event(enriched_event)
+        # Отправляем событие в Kafka; при недоступности брокера - в локальный spool
+        message = "Event accepted"
+        try:
+            event_id = await kafka_producer.send_event(enriched_event)
+        except ProducerQueueFullError:
+            if not spool_events([enriched_event], reason="queue_full"):
+                raise
+            event_id, message = enriched_event.event_id, "Event spooled"
+        except Exception:
+            if not spool_events([enriched_event], reason="kafka_error"):
+                raise
+            event_id, message = enriched_event.event_id, "Event spooled"
         
         # Обновляем метрики
-        update_metrics(success=True)
+        latency = time.perf_counter() - started
+        update_metrics(success=True, latency=latency)
+        REQUEST_LATENCY.labels(endpoint="events").observe(latency)
         
-        logger.info(f"Event collected: {event.event_type} from user {event.user_id}")
+        logger.debug(f"Event collected: {event.event_type} from user {event.user_id}")
         
         return EventResponse(
+            message=message,
             event_id=event_id,
             timestamp=datetime.utcnow().isoformat()
         )
         
+    except ProducerQueueFullError as e:
+        logger.warning(f"Event rejected, producer queue is full: {e}")
+        update_metrics(success=False)
+        EVENTS_REJECTED.labels(reason="queue_full").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Event queue is full, retry later",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Failed to process event: {e}")
         update_metrics(success=False)
+        EVENTS_REJECTED.labels(reason="kafka_error").inc()
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process event: {str(e)}"
         )
 
+def parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """Разбор тела пачки: JSON-массив или NDJSON (по одному событию на строку)"""
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return [line for line in body.splitlines() if line.strip()]
+    
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Batch body must be a JSON array of events")
+    return items
+
+@app.post("/events/batch", response_model=BatchEventResponse, status_code=202)
+async def collect_events_batch(request: Request):
+    """
+    Принимает пачку событий (JSON-массив или NDJSON) и отправляет их в Kafka одной передачей
+    """
+    started = time.perf_counter()
+    try:
+        items = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {str(e)}")
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(items)} events (max {MAX_BATCH_SIZE})"
+        )
+    EVENTS_RECEIVED.labels(endpoint="events_batch").inc(len(items))
+    BATCH_SIZE.observe(len(items))
+    
+    # Валидация всех событий за один проход
+    validation_started = time.perf_counter()
+    results: List[BatchItemResult] = []
+    valid: List[tuple] = []
+    client_ip = request.client.host
+    received_at = datetime.utcnow().isoformat()
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, (bytes, str)):
+                event = EventPayload.model_validate_json(item)
+            else:
+                event = EventPayload.model_validate(item)
+        except ValidationError as e:
+            results.append(BatchItemResult(
+                index=index,
+                status="rejected",
+                error=f"Validation failed: {e.errors()[0].get('msg', 'invalid event')}"
+            ))
+            continue
+        valid.append((index, EnrichedEvent.from_payload(
+            event,
+            client_ip=client_ip,
+            received_at=received_at
+        )))
+    VALIDATION_LATENCY.labels(endpoint="events_batch").observe(time.perf_counter() - validation_started)
+    if results:
+        EVENTS_REJECTED.labels(reason="validation").inc(len(results))
+    
+    if valid:
+        events = [event for _, event in valid]
+        spooled = False
+        try:
+            event_ids = await kafka_producer.send_events(events)
+        except ProducerQueueFullError as e:
+            if not spool_events(events, reason="queue_full"):
+                logger.warning(f"Batch rejected, producer queue is full: {e}")
+                update_metrics(success=False, count=len(valid))
+                EVENTS_REJECTED.labels(reason="queue_full").inc(len(valid))
+                raise HTTPException(
+                    status_code=503,
+                    detail="Event queue is full, retry later",
+                    headers={"Retry-After": "1"}
+                )
+            event_ids, spooled = [None] * len(events), True
+        except Exception as e:
+            if not spool_events(events, reason="kafka_error"):
+                logger.error(f"Failed to process batch: {e}")
+                update_metrics(success=False, count=len(valid))
+                EVENTS_REJECTED.labels(reason="kafka_error").inc(len(valid))
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to process batch: {str(e)}"
+                )
+            event_ids, spooled = [None] * len(events), True
+        
+        # Неотправленные события - в локальный spool
+        unsent = [event for event, event_id in zip(events, event_ids) if event_id is None]
+        if unsent and not spooled:
+            spooled = spool_events(unsent, reason="kafka_error")
+            if not spooled:
+                EVENTS_REJECTED.labels(reason="kafka_error").inc(len(unsent))
+        for (index, event), event_id in zip(valid, event_ids):
+            if event_id is not None:
+                results.append(BatchItemResult(index=index, status="accepted", event_id=event_id))
+            elif spooled:
+                results.append(BatchItemResult(index=index, status="spooled", event_id=event.event_id))
+            else:
+                results.append(BatchItemResult(index=index, status="rejected", error="Failed to send event"))
+    
+    results.sort(key=lambda r: r.index)
+    spooled_count = sum(1 for r in results if r.status == "spooled")
+    accepted = sum(1 for r in results if r.status == "accepted") + spooled_count
+    rejected = len(results) - accepted
+    latency = time.perf_counter() - started
+    REQUEST_LATENCY.labels(endpoint="events_batch").observe(latency)
+    if accepted:
+        update_metrics(success=True, count=accepted, latency=latency)
+    if rejected:
+        update_metrics(success=False, count=rejected)
+    
+    logger.info(f"Batch collected: {accepted} accepted ({spooled_count} spooled), {rejected} rejected")
+    
+    return BatchEventResponse(
+        accepted=accepted,
+        rejected=rejected,
+        spooled=spooled_count,
+        results=results,
+        timestamp=datetime.utcnow().isoformat()
+    )
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """
@@ -128,7 +377,7 @@ async def health_check():
             status="healthy" if kafka_connected else "degraded",
             timestamp=datetime.utcnow(),
             kafka_connected=kafka_connected,
-            events_processed=metrics["events_total"]
+            events_processed=rate_window.totals()["events_total"]
         )
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -137,19 +386,27 @@ async def health_check():
             detail="Service unavailable"
         )
 
-@app.get("/metrics", response_model=MetricsResponse)
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    """
+    Метрики сервиса в формате Prometheus
+    """
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
+@app.get("/metrics/summary", response_model=MetricsResponse)
 async def get_metrics():
     """
-    Метрики сервиса
+    Краткая сводка метрик сервиса в JSON
     """
     try:
         kafka_metrics = await kafka_producer.get_metrics()
+        window = rate_window.snapshot()
         
         return MetricsResponse(
-            events_total=metrics["events_total"],
-            events_per_minute=metrics["events_per_minute"],
-            errors_total=metrics["errors_total"],
-            kafka_queue_size=kafka_metrics.get("events_sent", 0)
+            kafka_queue_size=kafka_metrics.get("in_flight", 0),
+            spool_records=spool.pending_records if spool else 0,
+            **window
         )
     except Exception as e:
         logger.error(f"Failed to get metrics: {e}")
@@ -172,11 +429,6 @@ async def root():
     }
 
 if __name__ == "__main__":
-    port = int(os.getenv("COLLECTOR_PORT", "8002"))
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    # Запуск с настройками воркеров из serve.py (COLLECTOR_WORKERS, COLLECTOR_RELOAD)
+    from serve import main as serve
+    serve()
@@ -0,0 +1,173 @@
+import glob
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+# Границы корзин гистограммы задержек (мс): геометрическая шкала 0.1ms .. ~29s
+LATENCY_BUCKETS_MS = [0.1 * 1.5 ** i for i in range(32)]
+_LATENCY_LOG_BASE = math.log(1.5)
+
+# Заголовок буфера: счетчики событий и ошибок за все время работы процесса
+_TOTAL_EVENTS, _TOTAL_ERRORS = 0, 1
+HEADER_SIZE = 2
+
+# Раскладка одного слота кольцевого буфера: [секунда, события, ошибки, корзины задержек..., переполнение]
+_SECOND, _EVENTS, _ERRORS, _HIST = 0, 1, 2, 3
+SLOT_SIZE = _HIST + len(LATENCY_BUCKETS_MS) + 1
+
+def _latency_bucket(latency_ms: float) -> int:
+    """Индекс корзины гистограммы для задержки (O(1), без поиска)"""
+    if latency_ms <= LATENCY_BUCKETS_MS[0]:
+        return 0
+    index = math.ceil(math.log(latency_ms / LATENCY_BUCKETS_MS[0]) / _LATENCY_LOG_BASE)
+    return min(index, len(LATENCY_BUCKETS_MS))
+
+class SlidingWindowMetrics:
+    """
+    Скользящее окно метрик на кольцевом буфере посекундных слотов.
+
+    Запись и чтение выполняются за постоянное время и память: на каждую секунду
+    окна хранится счетчик событий, ошибок и гистограмма задержек, а в заголовке
+    буфера - общие счетчики процесса.
+    Если задан storage_dir, буфер каждого процесса лежит в отдельном
+    mmap-файле этого каталога, и snapshot()/totals() суммируют все воркеры.
+    Файл остановленного воркера остается (его слоты устаревают сами, а общие
+    счетчики продолжают учитываться); каталог очищается при запуске сервиса.
+    """
+
+    def __init__(self, window_seconds: int = 60, storage_dir: Optional[str] = None):
+        self.window_seconds = window_seconds
+        self.storage_dir = storage_dir
+        self._lock = threading.Lock()
+        self._path = None
+        size = HEADER_SIZE + window_seconds * SLOT_SIZE
+
+        if storage_dir:
+            os.makedirs(storage_dir, exist_ok=True)
+            self._path = os.path.join(storage_dir, f"rate_{os.getpid()}.bin")
+            with open(self._path, "wb") as f:
+                f.write(b"\0" * size * 8)
+            with open(self._path, "r+b") as f:
+                self._mmap = mmap.mmap(f.fileno(), size * 8)
+            self._slots = memoryview(self._mmap).cast("q")
+        else:
+            self._slots = array("q", [0] * size)
+
+    @classmethod
+    def from_env(cls) -> "SlidingWindowMetrics":
+        """Создание окна по переменным окружения"""
+        return cls(
+            window_seconds=int(os.getenv("METRICS_WINDOW_SECONDS", "60")),
+            storage_dir=os.getenv("COLLECTOR_METRICS_DIR") or None
+        )
+
+    def _slot(self, second: int) -> int:
+        """Смещение слота для секунды; устаревший слот обнуляется"""
+        offset = HEADER_SIZE + (second % self.window_seconds) * SLOT_SIZE
+        slots = self._slots
+        if slots[offset + _SECOND] != second:
+            for i in range(offset + 1, offset + SLOT_SIZE):
+                slots[i] = 0
+            slots[offset + _SECOND] = second
+        return offset
+
+    def record(self, success: bool = True, latency: Optional[float] = None, count: int = 1):
+        """Учет count событий (или ошибок); latency - задержка обработки в секундах"""
+        second = int(time.time())
+        with self._lock:
+            offset = self._slot(second)
+            slots = self._slots
+            if success:
+                slots[offset + _EVENTS] += count
+                slots[_TOTAL_EVENTS] += count
+            else:
+                slots[offset + _ERRORS] += count
+                slots[_TOTAL_ERRORS] += count
+            if latency is not None:
+                slots[offset + _HIST + _latency_bucket(latency * 1000)] += 1
+
+    def _sources(self) -> List:
+        """Буферы, участвующие в агрегации: свой и (при storage_dir) остальных воркеров"""
+        if not self.storage_dir:
+            return [self._slots]
+
+        sources = []
+        for path in glob.glob(os.path.join(self.storage_dir, "rate_*.bin")):
+            if path == self._path:
+                sources.append(self._slots)
+                continue
+            try:
+                with open(path, "rb") as f:
+                    sources.append(array("q", f.read()))
+            except OSError:
+                # Файл удален во время чтения (очистка каталога)
+                continue
+        return sources
+
+    def totals(self) -> Dict[str, int]:
+        """Общие счетчики событий и ошибок по всем воркерам"""
+        with self._lock:
+            sources = self._sources()
+            return {
+                "events_total": sum(slots[_TOTAL_EVENTS] for slots in sources),
+                "errors_total": sum(slots[_TOTAL_ERRORS] for slots in sources)
+            }
+
+    def snapshot(self) -> Dict[str, float]:
+        """События/ошибки за окно и перцентили задержки (мс) по всем воркерам"""
+        oldest = int(time.time()) - self.window_seconds + 1
+        events = errors = events_total = errors_total = 0
+        histogram = [0] * (SLOT_SIZE - _HIST)
+
+        with self._lock:
+            sources = self._sources()
+            for slots in sources:
+                events_total += slots[_TOTAL_EVENTS]
+                errors_total += slots[_TOTAL_ERRORS]
+                for offset in range(HEADER_SIZE, HEADER_SIZE + self.window_seconds * SLOT_SIZE, SLOT_SIZE):
+                    if slots[offset + _SECOND] < oldest:
+                        continue
+                    events += slots[offset + _EVENTS]
+                    errors += slots[offset + _ERRORS]
+                    for i in range(len(histogram)):
+                        histogram[i] += slots[offset + _HIST + i]
+
+        return {
+            "events_total": events_total,
+            "errors_total": errors_total,
+            "events_per_minute": events * 60 / self.window_seconds,
+            "errors_per_minute": errors * 60 / self.window_seconds,
+            "latency_p50_ms": _percentile(histogram, 0.50),
+            "latency_p95_ms": _percentile(histogram, 0.95),
+            "latency_p99_ms": _percentile(histogram, 0.99)
+        }
+
+    def close(self):
+        """Закрытие mmap-буфера процесса (файл остается для общих счетчиков)"""
+        if self._path:
+            self._slots.release()
+            self._mmap.close()
+            self._slots = array("q", [0] * (HEADER_SIZE + self.window_seconds * SLOT_SIZE))
+            self._path = None
+
+def _percentile(histogram: List[int], quantile: float) -> float:
+    """Перцентиль по гистограмме с линейной интерполяцией внутри корзины"""
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            if index >= len(LATENCY_BUCKETS_MS):
+                return round(LATENCY_BUCKETS_MS[-1], 3)
+            lower = LATENCY_BUCKETS_MS[index - 1] if index else 0.0
+            upper = LATENCY_BUCKETS_MS[index]
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 3)
+        cumulative += count
+    return round(LATENCY_BUCKETS_MS[-1], 3)
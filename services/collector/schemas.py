@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
+import uuid
 
 class EventPayload(BaseModel):
     """Схема для входящих событий от фронтенда"""
@@ -13,12 +14,46 @@ class EventPayload(BaseModel):
     screen_resolution: str = Field(..., max_length=50)
     additional_data: Optional[Dict[str, Any]] = {}
 
+class EnrichedEvent(EventPayload):
+    """Событие с метаданными коллектора в том виде, в каком оно пишется в Kafka"""
+    event_id: str
+    client_ip: Optional[str] = None
+    received_at: str
+    service: str = "collector"
+
+    @classmethod
+    def from_payload(cls, event: EventPayload, client_ip: Optional[str], received_at: str) -> "EnrichedEvent":
+        """Присвоение event_id и сборка без повторной валидации уже проверенных полей"""
+        return cls.model_construct(
+            event_id=str(uuid.uuid4()),
+            client_ip=client_ip,
+            received_at=received_at,
+            service="collector",
+            **event.__dict__
+        )
+
 class EventResponse(BaseModel):
     """Ответ при успешном приеме события"""
     message: str = "Event accepted"
     event_id: str
     timestamp: str
 
+class BatchItemResult(BaseModel):
+    """Результат обработки одного события из пачки"""
+    index: int
+    status: str  # "accepted" | "spooled" | "rejected"
+    event_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchEventResponse(BaseModel):
+    """Ответ на пачку событий"""
+    message: str = "Batch processed"
+    accepted: int
+    rejected: int
+    spooled: int = 0  # из accepted: записано в локальный spool до восстановления Kafka
+    results: List[BatchItemResult]
+    timestamp: str
+
 class HealthResponse(BaseModel):
     """Ответ health check"""
     status: str
@@ -31,4 +66,9 @@ class MetricsResponse(BaseModel):
     events_total: int
     events_per_minute: float
     errors_total: int
-    kafka_queue_size: int
\ No newline at end of file
+    errors_per_minute: float = 0.0
+    latency_p50_ms: float = 0.0
+    latency_p95_ms: float = 0.0
+    latency_p99_ms: float = 0.0
+    kafka_queue_size: int
+    spool_records: int = 0
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Заголовок записи Kafka с именем кодека, по которому consumer выбирает декодер
+CODEC_HEADER = "event-codec"
+
+class EventCodec(ABC):
+    """
+    Кодек значения записи Kafka.
+    Кодирует поля провалидированной модели напрямую из model.__dict__,
+    без model.dict() и промежуточных копий.
+    """
+    name = ""
+    content_type = ""
+
+    @abstractmethod
+    def encode(self, event: BaseModel) -> bytes:
+        """Сериализация модели события в значение записи"""
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """Разбор значения записи в словарь полей события"""
+
+    @property
+    def headers(self) -> List[Tuple[str, bytes]]:
+        """Заголовки записи Kafka для этого кодека"""
+        return [(CODEC_HEADER, self.name.encode("utf-8"))]
+
+class JsonCodec(EventCodec):
+    """Стандартный json (без внешних зависимостей)"""
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, event: BaseModel) -> bytes:
+        return json.dumps(event.__dict__, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return json.loads(data)
+
+class OrjsonCodec(EventCodec):
+    """orjson: тот же JSON на выходе, но в разы быстрее стандартного модуля"""
+    name = "orjson"
+    content_type = "application/json"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, event: BaseModel) -> bytes:
+        return self._orjson.dumps(event.__dict__)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return self._orjson.loads(data)
+
+class MsgpackCodec(EventCodec):
+    """MessagePack: компактный бинарный формат"""
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, event: BaseModel) -> bytes:
+        return self._msgpack.packb(event.__dict__, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        return self._msgpack.unpackb(data, raw=False)
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+def get_codec(name: str = None) -> EventCodec:
+    """
+    Кодек по имени (KAFKA_VALUE_CODEC).
+    Если библиотека кодека не установлена, используется стандартный json.
+    """
+    name = (name or os.getenv("KAFKA_VALUE_CODEC", JsonCodec.name)).lower()
+    if name not in CODECS:
+        raise ValueError(f"Unknown KAFKA_VALUE_CODEC '{name}', expected one of {tuple(CODECS)}")
+
+    try:
+        return CODECS[name]()
+    except ImportError as e:
+        logger.warning(f"Codec '{name}' unavailable ({e}), falling back to '{JsonCodec.name}'")
+        return JsonCodec()
+
+def decode_value(data: bytes, headers: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+    """Декодирование значения записи по заголовку кодека (для consumer'ов)"""
+    codec_name = JsonCodec.name
+    for key, value in headers or []:
+        if key == CODEC_HEADER:
+            codec_name = value.decode("utf-8")
+            break
+    return get_codec(codec_name).decode(data)
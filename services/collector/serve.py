@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Запуск collector'а.
+
+Продакшен (по умолчанию): COLLECTOR_WORKERS воркеров uvicorn (0 - по числу ядер)
+с uvloop и httptools. Каждый воркер - отдельный процесс со своим Kafka producer'ом,
+который инициализируется в lifespan и дописывает буфер при остановке воркера.
+Метрики воркеров агрегируются через общие каталоги: PROMETHEUS_MULTIPROC_DIR
+(Prometheus) и COLLECTOR_METRICS_DIR (сводка /metrics/summary).
+
+Разработка: COLLECTOR_RELOAD=true - один процесс с автоперезагрузкой.
+
+Примеры:
+    python serve.py
+    COLLECTOR_WORKERS=4 python serve.py
+    COLLECTOR_RELOAD=true python serve.py
+"""
+
+import logging
+import os
+import shutil
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+def prepare_shared_dir(path: str):
+    """Пустой каталог для файлов метрик воркеров (файлы прошлого запуска удаляются)"""
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def main():
+    port = int(os.getenv("COLLECTOR_PORT", "8002"))
+    log_level = os.getenv("LOG_LEVEL", "info").lower()
+
+    if os.getenv("COLLECTOR_RELOAD", "false").lower() == "true":
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            reload=True,
+            log_level=log_level
+        )
+        return
+
+    workers = int(os.getenv("COLLECTOR_WORKERS", "0")) or os.cpu_count() or 1
+    if workers > 1:
+        # Переменные наследуются воркерами и должны быть заданы до импорта prometheus_client в них
+        runtime_dir = os.getenv("COLLECTOR_RUNTIME_DIR", "/tmp/collector")
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(runtime_dir, "prometheus"))
+        os.environ.setdefault("COLLECTOR_METRICS_DIR", os.path.join(runtime_dir, "rate"))
+        prepare_shared_dir(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+        prepare_shared_dir(os.environ["COLLECTOR_METRICS_DIR"])
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Starting collector with {workers} worker(s) on port {port}")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        # Время на завершение запросов при остановке; затем lifespan дописывает буфер producer'а
+        timeout_graceful_shutdown=int(os.getenv("COLLECTOR_GRACEFUL_SHUTDOWN_SECONDS", "20")),
+        log_level=log_level
+    )
+
+if __name__ == "__main__":
+    main()
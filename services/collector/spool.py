@@ -0,0 +1,325 @@
+import fcntl
+import glob
+import logging
+import os
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from kafka_client import KafkaRecord
+from instrumentation import SPOOL_RECORDS, SPOOL_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Кадр записи: длина тела и crc32 тела, затем тело
+_FRAME = struct.Struct(">II")
+# Тело: длина ключа (-1 - без ключа), длина значения, число заголовков
+_BODY = struct.Struct(">iIH")
+# Заголовок: длина имени, длина значения
+_HEADER = struct.Struct(">HI")
+
+SEGMENT_PATTERN = "segment-*.log"
+OFFSET_FILE = "offset"
+LOCK_FILE = "lock"
+
+class SpoolFullError(RuntimeError):
+    """Локальный spool достиг лимита COLLECTOR_SPOOL_MAX_BYTES"""
+
+class SpooledRecord(NamedTuple):
+    """Запись, прочитанная из spool, и позиция сразу за ней"""
+    record: KafkaRecord
+    segment: int
+    position: int
+    size: int
+
+def encode_record(record: KafkaRecord) -> bytes:
+    """Кодирование записи Kafka в кадр сегмента"""
+    key = record.key
+    parts = [_BODY.pack(-1 if key is None else len(key), len(record.value), len(record.headers))]
+    if key is not None:
+        parts.append(key)
+    parts.append(record.value)
+    for name, value in record.headers:
+        name_bytes = name.encode("utf-8")
+        parts.append(_HEADER.pack(len(name_bytes), len(value)))
+        parts.append(name_bytes)
+        parts.append(value)
+    body = b"".join(parts)
+    return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+def decode_record(body: bytes) -> KafkaRecord:
+    """Разбор тела кадра обратно в запись Kafka"""
+    key_length, value_length, header_count = _BODY.unpack_from(body)
+    offset = _BODY.size
+    key = None
+    if key_length >= 0:
+        key = body[offset:offset + key_length]
+        offset += key_length
+    value = body[offset:offset + value_length]
+    offset += value_length
+    headers = []
+    for _ in range(header_count):
+        name_length, header_length = _HEADER.unpack_from(body, offset)
+        offset += _HEADER.size
+        name = body[offset:offset + name_length].decode("utf-8")
+        offset += name_length
+        headers.append((name, body[offset:offset + header_length]))
+        offset += header_length
+    return KafkaRecord(key, value, headers)
+
+class DiskSpool:
+    """
+    Локальный spool событий на случай недоступности Kafka.
+
+    Записи дописываются в конец сегментных файлов (append-only), сегмент
+    закрывается по достижении segment_bytes. Позиция чтения (сегмент, смещение)
+    хранится в отдельном файле и сдвигается только после подтверждения
+    брокером; полностью прочитанные сегменты удаляются.
+
+    Каждый процесс берет свой слот-подкаталог под flock, поэтому воркеры uvicorn
+    не пишут в одни и те же файлы, а перезапущенный воркер подхватывает слот
+    (и недоставленные записи) завершившегося процесса. Записи из слотов, которые
+    остались без владельца (воркеров стало меньше), переносятся в свой слот при open.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024, max_slots: int = 64):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_slots = max_slots
+        self.path = None
+        self.pending_records = 0
+        self.pending_bytes = 0
+        self._lock_file = None
+        self._writer = None
+        self._write_segment = 0
+        self._write_position = 0
+        self._read_segment = 0
+        self._read_position = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["DiskSpool"]:
+        """Создание spool по переменным окружения (None, если COLLECTOR_SPOOL_DIR не задан)"""
+        directory = os.getenv("COLLECTOR_SPOOL_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            segment_bytes=int(os.getenv("COLLECTOR_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+            max_bytes=int(os.getenv("COLLECTOR_SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+        )
+
+    def open(self):
+        """Захват свободного слота и восстановление состояния с диска"""
+        os.makedirs(self.directory, exist_ok=True)
+        for slot in range(self.max_slots):
+            path = os.path.join(self.directory, f"slot-{slot:02d}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = self._lock_slot(path)
+            if lock_file is None:
+                continue
+            self.path = path
+            self._lock_file = lock_file
+            break
+        else:
+            raise RuntimeError(f"No free spool slot in {self.directory} (max {self.max_slots})")
+
+        self._recover()
+        self._adopt_orphans()
+        self._update_gauges()
+        logger.info(
+            f"Spool opened at {self.path}: {self.pending_records} pending records "
+            f"({self.pending_bytes} bytes)"
+        )
+
+    @staticmethod
+    def _lock_slot(path: str):
+        """flock слота без ожидания; None, если слот занят другим процессом"""
+        lock_file = open(os.path.join(path, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _adopt_orphans(self, batch: int = 1000):
+        """
+        Перенос недоставленных записей из свободных слотов в свой.
+
+        Replay читает только свой слот, поэтому после уменьшения COLLECTOR_WORKERS
+        записи в слотах с большими номерами иначе не были бы доставлены. Позиция
+        чужого слота сдвигается после каждой пачки: сбой посреди переноса приводит
+        лишь к повтору одной пачки.
+        """
+        for path in sorted(glob.glob(os.path.join(self.directory, "slot-*"))):
+            if path == self.path or not os.path.isdir(path):
+                continue
+            lock_file = self._lock_slot(path)
+            if lock_file is None:
+                continue
+            orphan = DiskSpool(self.directory, self.segment_bytes, self.max_bytes)
+            orphan.path = path
+            orphan._lock_file = lock_file
+            try:
+                orphan._recover()
+                if orphan.pending_records:
+                    logger.warning(
+                        f"Adopting {orphan.pending_records} pending records from orphaned spool slot {path}"
+                    )
+                while True:
+                    entries = orphan.read(batch)
+                    if not entries:
+                        break
+                    self.append([entry.record for entry in entries])
+                    orphan.commit(entries)
+            except SpoolFullError as e:
+                logger.error(
+                    f"Spool slot {path} left with {orphan.pending_records} pending records: {e}"
+                )
+            finally:
+                orphan.close()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:012d}.log")
+
+    def _segments(self) -> List[int]:
+        """Номера сегментов слота по возрастанию"""
+        names = glob.glob(os.path.join(self.path, SEGMENT_PATTERN))
+        return sorted(int(os.path.basename(name)[8:-4]) for name in names)
+
+    def _recover(self):
+        """Чтение позиции, подсчет недоставленных записей и отрезание недописанного хвоста"""
+        segments = self._segments()
+        self._read_segment, self._read_position = self._load_offset()
+        if segments and self._read_segment < segments[0]:
+            self._read_segment, self._read_position = segments[0], 0
+
+        for segment in segments:
+            if segment < self._read_segment:
+                os.remove(self._segment_path(segment))
+                continue
+            start = self._read_position if segment == self._read_segment else 0
+            records, size, valid_end = self._scan(segment, start)
+            self.pending_records += records
+            self.pending_bytes += size
+            if valid_end < os.path.getsize(self._segment_path(segment)):
+                logger.warning(f"Truncating torn spool record in segment {segment} at {valid_end}")
+                os.truncate(self._segment_path(segment), valid_end)
+
+        self._write_segment = max(segments[-1] if segments else 0, self._read_segment)
+        self._open_writer()
+
+    def _scan(self, segment: int, start: int) -> Tuple[int, int, int]:
+        """Количество и размер целых записей сегмента начиная с start; конец последней целой записи"""
+        records = size = 0
+        position = start
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(start)
+            while True:
+                frame = f.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    break
+                length, crc = _FRAME.unpack(frame)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                records += 1
+                size += _FRAME.size + length
+                position += _FRAME.size + length
+        return records, size, position
+
+    def _load_offset(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.path, OFFSET_FILE)) as f:
+                segment, position = f.read().split()
+                return int(segment), int(position)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_offset(self):
+        """Атомарная запись позиции чтения"""
+        path = os.path.join(self.path, OFFSET_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{self._read_segment} {self._read_position}")
+        os.replace(path + ".tmp", path)
+
+    def _open_writer(self):
+        if self._writer:
+            self._writer.close()
+        self._writer = open(self._segment_path(self._write_segment), "ab")
+        self._write_position = self._writer.tell()
+
+    def append(self, records: List[KafkaRecord]):
+        """Дописывание записей в текущий сегмент (SpoolFullError при превышении лимита)"""
+        data = b"".join(encode_record(record) for record in records)
+        if self.pending_bytes + len(data) > self.max_bytes:
+            raise SpoolFullError(
+                f"Spool is full ({self.pending_bytes}/{self.max_bytes} bytes)"
+            )
+        if self._write_position >= self.segment_bytes:
+            self._write_segment += 1
+            self._open_writer()
+
+        self._writer.write(data)
+        self._writer.flush()
+        self._write_position += len(data)
+        self.pending_records += len(records)
+        self.pending_bytes += len(data)
+        self._update_gauges()
+
+    def read(self, limit: int) -> List[SpooledRecord]:
+        """Чтение до limit записей от позиции чтения (позиция не сдвигается до commit)"""
+        entries: List[SpooledRecord] = []
+        segment, position = self._read_segment, self._read_position
+        while len(entries) < limit and segment <= self._write_segment:
+            path = self._segment_path(segment)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    while len(entries) < limit:
+                        frame = f.read(_FRAME.size)
+                        if len(frame) < _FRAME.size:
+                            break
+                        length, _ = _FRAME.unpack(frame)
+                        body = f.read(length)
+                        if len(body) < length:
+                            break
+                        position += _FRAME.size + length
+                        entries.append(SpooledRecord(decode_record(body), segment, position, _FRAME.size + length))
+            if len(entries) >= limit or segment == self._write_segment:
+                break
+            segment, position = segment + 1, 0
+        return entries
+
+    def commit(self, entries: List[SpooledRecord]):
+        """Сдвиг позиции чтения за доставленные записи и удаление прочитанных сегментов"""
+        if not entries:
+            return
+        last = entries[-1]
+        for segment in range(self._read_segment, last.segment):
+            path = self._segment_path(segment)
+            if os.path.exists(path):
+                os.remove(path)
+        self._read_segment, self._read_position = last.segment, last.position
+        self._save_offset()
+        self.pending_records -= len(entries)
+        self.pending_bytes -= sum(entry.size for entry in entries)
+        self._update_gauges()
+
+    def _update_gauges(self):
+        SPOOL_RECORDS.set(self.pending_records)
+        SPOOL_BYTES.set(self.pending_bytes)
+
+    def close(self):
+        """Закрытие файлов и освобождение слота"""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        SPOOL_RECORDS.set(0)
+        SPOOL_BYTES.set(0)
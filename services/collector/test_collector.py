@@ -66,7 +66,7 @@ async def test_metrics():
     print("\n📈 Testing metrics...")
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(f"{COLLECTOR_URL}/metrics")
+            response = await client.get(f"{COLLECTOR_URL}/metrics/summary")
             print(f"Metrics status: {response.status_code}")
             if response.status_code == 200:
                 data = response.json()
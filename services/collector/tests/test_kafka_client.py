@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from kafka_client import KafkaEventProducer, KafkaRecord, ProducerQueueFullError
+
+@pytest.fixture
+def producer(monkeypatch):
+    monkeypatch.setenv("KAFKA_MAX_IN_FLIGHT", "4")
+    producer = KafkaEventProducer()
+    producer.producer = object()
+    yield producer
+    producer.executor.shutdown(wait=False)
+
+def test_reservation_is_released_when_executor_is_closed(producer):
+    producer.executor.shutdown()
+    records = [KafkaRecord(None, b"{}", []) for _ in range(3)]
+
+    async def send_twice():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await producer.send_records(records)
+
+    asyncio.run(send_twice())
+    assert producer._in_flight == 0
+
+def test_reserve_beyond_limit_raises(producer):
+    producer._reserve(producer.max_in_flight)
+    with pytest.raises(ProducerQueueFullError):
+        producer._reserve(1)
+    producer._record_delivery(sent=producer.max_in_flight)
+    assert producer._in_flight == 0
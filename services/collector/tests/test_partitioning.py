@@ -0,0 +1,60 @@
+import pytest
+from kafka.partitioner.default import DefaultPartitioner
+
+from partitioning import EventPartitioner, key_hash
+
+# murmur2 из Java-клиента Kafka (те же значения в тестах librdkafka)
+MURMUR2_VECTORS = {
+    b"kafka": 0xd067cf64,
+    b"giberish123456789": 0x8f552b0c,
+    b"1234": 0x9fc97b14,
+    b"234": 0xe7c009ca,
+    b"34": 0x873930da,
+    b"4": 0x5a4b5ca1,
+    b"": 0x106e08d9,
+}
+
+KEYS = [f"user-{i}".encode() for i in range(500)] + [b"", "пользователь".encode()]
+
+@pytest.mark.parametrize("key,expected", MURMUR2_VECTORS.items())
+def test_key_hash_matches_java_murmur2(key, expected):
+    assert key_hash(key) == expected & 0x7fffffff
+
+@pytest.mark.parametrize("partitions", [1, 3, 12, 64])
+def test_keyed_records_match_kafka_python_default_partitioner(partitions):
+    all_partitions = list(range(partitions))
+    partitioner = EventPartitioner()
+    for key in KEYS:
+        assert partitioner(key, all_partitions, all_partitions) == \
+            DefaultPartitioner()(key, all_partitions, all_partitions)
+
+def test_keyed_records_match_aiokafka_default_partitioner():
+    aiokafka_partitioner = pytest.importorskip("aiokafka.partitioner")
+    all_partitions = list(range(12))
+    partitioner = EventPartitioner(sticky=True)
+    for key in KEYS:
+        assert partitioner(key, all_partitions, all_partitions) == \
+            aiokafka_partitioner.DefaultPartitioner()(key, all_partitions, all_partitions)
+
+def test_keyed_records_ignore_availability():
+    # Ключ всегда в свою партицию, даже если лидер временно недоступен
+    all_partitions = list(range(6))
+    partitioner = EventPartitioner()
+    for key in KEYS[:50]:
+        assert partitioner(key, all_partitions, [0]) == partitioner(key, all_partitions, all_partitions)
+
+def test_sticky_keyless_records_switch_after_batch():
+    all_partitions = list(range(4))
+    partitioner = EventPartitioner(sticky=True, sticky_records=5)
+    choices = [partitioner(None, all_partitions, all_partitions) for _ in range(15)]
+    assert len(set(choices[0:5])) == 1
+    assert len(set(choices[5:10])) == 1
+    assert choices[4] != choices[5]
+    assert choices[9] != choices[10]
+
+def test_sticky_partition_moves_off_unavailable_partition():
+    all_partitions = list(range(4))
+    partitioner = EventPartitioner(sticky=True, sticky_records=100)
+    first = partitioner(None, all_partitions, all_partitions)
+    available = [partition for partition in all_partitions if partition != first]
+    assert partitioner(None, all_partitions, available) in available
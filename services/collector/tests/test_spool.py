@@ -0,0 +1,172 @@
+import os
+
+import pytest
+
+from kafka_client import KafkaRecord
+from spool import DiskSpool, SpoolFullError, decode_record, encode_record
+
+def make_record(i: int, key: bool = True) -> KafkaRecord:
+    return KafkaRecord(
+        f"user-{i}".encode() if key else None,
+        f'{{"n":{i}}}'.encode(),
+        [("event-codec", b"json")]
+    )
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path / "spool")
+
+def open_spool(directory: str, **kwargs) -> DiskSpool:
+    spool = DiskSpool(directory, **kwargs)
+    spool.open()
+    return spool
+
+def test_encode_decode_roundtrip():
+    for record in (make_record(1), make_record(2, key=False), KafkaRecord(b"", b"", [])):
+        frame = encode_record(record)
+        assert decode_record(frame[8:]) == record
+
+def test_read_does_not_advance_until_commit(spool_dir):
+    spool = open_spool(spool_dir)
+    spool.append([make_record(i) for i in range(5)])
+
+    first = spool.read(3)
+    assert [entry.record for entry in first] == [make_record(i) for i in range(3)]
+    assert [entry.record for entry in spool.read(3)] == [make_record(i) for i in range(3)]
+
+    spool.commit(first)
+    assert spool.pending_records == 2
+    assert [entry.record for entry in spool.read(10)] == [make_record(3), make_record(4)]
+    spool.close()
+
+def test_commit_survives_reopen(spool_dir):
+    spool = open_spool(spool_dir)
+    spool.append([make_record(i) for i in range(4)])
+    spool.commit(spool.read(1))
+    pending_bytes = spool.pending_bytes
+    spool.close()
+
+    spool = open_spool(spool_dir)
+    assert spool.pending_records == 3
+    assert spool.pending_bytes == pending_bytes
+    assert [entry.record for entry in spool.read(10)] == [make_record(i) for i in range(1, 4)]
+    spool.close()
+
+@pytest.mark.parametrize("tail", [
+    b"\x00\x00",                                  # обрыв внутри заголовка кадра
+    b"\x00\x00\x00\x40\x00\x00\x00\x00abc",       # обрыв внутри тела
+])
+def test_torn_tail_is_truncated_on_open(spool_dir, tail):
+    spool = open_spool(spool_dir)
+    spool.append([make_record(i) for i in range(3)])
+    segment_path = spool._segment_path(spool._write_segment)
+    valid_size = os.path.getsize(segment_path)
+    spool.close()
+
+    with open(segment_path, "ab") as f:
+        f.write(tail)
+
+    spool = open_spool(spool_dir)
+    assert os.path.getsize(segment_path) == valid_size
+    assert spool.pending_records == 3
+
+    # Запись после отрезанного хвоста читается вместе с прежними
+    spool.append([make_record(3)])
+    assert [entry.record for entry in spool.read(10)] == [make_record(i) for i in range(4)]
+    spool.close()
+
+def test_corrupted_tail_record_is_truncated(spool_dir):
+    spool = open_spool(spool_dir)
+    spool.append([make_record(0)])
+    segment_path = spool._segment_path(spool._write_segment)
+    valid_size = os.path.getsize(segment_path)
+    spool.append([make_record(1)])
+    spool.close()
+
+    # Порча последнего байта тела: crc не сходится
+    with open(segment_path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    spool = open_spool(spool_dir)
+    assert os.path.getsize(segment_path) == valid_size
+    assert [entry.record for entry in spool.read(10)] == [make_record(0)]
+    spool.close()
+
+def test_segments_roll_over_and_are_removed_after_commit(spool_dir):
+    record_size = len(encode_record(make_record(0)))
+    spool = open_spool(spool_dir, segment_bytes=record_size * 2)
+    for i in range(6):
+        spool.append([make_record(i)])
+    assert len(spool._segments()) == 3
+
+    entries = spool.read(10)
+    assert [entry.record for entry in entries] == [make_record(i) for i in range(6)]
+    spool.commit(entries[:5])
+    assert spool._segments() == [spool._write_segment]
+    assert spool.pending_records == 1
+    spool.close()
+
+def test_append_beyond_max_bytes_is_rejected(spool_dir):
+    record_size = len(encode_record(make_record(0)))
+    spool = open_spool(spool_dir, max_bytes=record_size * 2)
+    spool.append([make_record(0), make_record(1)])
+    with pytest.raises(SpoolFullError):
+        spool.append([make_record(2)])
+    assert spool.pending_records == 2
+
+    spool.commit(spool.read(1))
+    spool.append([make_record(2)])
+    spool.close()
+
+def test_each_process_gets_its_own_slot(spool_dir):
+    first = open_spool(spool_dir)
+    second = open_spool(spool_dir)
+    assert first.path != second.path
+    second.close()
+    first.close()
+
+def test_orphaned_slot_is_adopted_on_open(spool_dir):
+    spools = [open_spool(spool_dir) for _ in range(3)]
+    spools[0].append([make_record(0)])
+    spools[2].append([make_record(i) for i in range(1, 4)])
+    for spool in reversed(spools):
+        spool.close()
+
+    # Воркеров стало меньше: единственный процесс забирает записи третьего слота
+    spool = open_spool(spool_dir)
+    assert spool.pending_records == 4
+    assert [entry.record for entry in spool.read(10)] == [make_record(i) for i in range(4)]
+
+    other = open_spool(spool_dir)
+    assert other.pending_records == 0
+    other.close()
+    spool.close()
+
+def test_locked_slot_is_not_adopted(spool_dir):
+    first = open_spool(spool_dir)
+    first.append([make_record(0)])
+    second = open_spool(spool_dir)
+    assert second.pending_records == 0
+    assert first.pending_records == 1
+    second.close()
+    first.close()
+
+def test_orphan_that_does_not_fit_is_kept(spool_dir):
+    record_size = len(encode_record(make_record(0)))
+    first, second = open_spool(spool_dir), open_spool(spool_dir)
+    first.append([make_record(0)])
+    second.append([make_record(i) for i in range(1, 3)])
+    second.close()
+    first.close()
+
+    spool = open_spool(spool_dir, max_bytes=record_size * 2)
+    assert spool.pending_records == 1
+    spool.close()
+
+    # С большим лимитом записи слота переносятся при следующем запуске
+    spool = open_spool(spool_dir)
+    assert spool.pending_records == 3
+    spool.close()